@@ -0,0 +1,122 @@
+"""
+Fair-Share Admission Control for Extractions
+A fixed pool of worker threads (default: one per core) runs extraction tasks queued
+per user. Workers take tasks from users in round-robin order, so a user with a
+2,000-file batch cannot starve another user's 3-file batch. Queues are bounded; a
+batch that does not fit is rejected with a retry hint instead of being queued.
+"""
+
+import os
+import math
+import time
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+
+
+class QueueFull(Exception):
+    """Raised when a batch cannot be admitted; retry_after is a suggested wait in seconds."""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class FairScheduler:
+    """Round-robin scheduler over per-user FIFO queues, run by `workers` threads."""
+
+    def __init__(self, workers=None, max_queued_per_user=500, max_queued=5000):
+        self.workers = workers or os.cpu_count() or 1
+        self.max_queued_per_user = max_queued_per_user
+        self.max_queued = max_queued
+        self._queues = OrderedDict()  # user -> deque of (future, func, args, kwargs); order = round-robin turn
+        self._running = {}
+        self._queued_total = 0
+        self._avg_task_seconds = 1.0
+        self._cond = threading.Condition()
+        self._threads = []
+
+    def _ensure_started(self):
+        # Threads start lazily so importing the app (e.g. on Vercel) spawns nothing
+        if self._threads:
+            return
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f'extract-worker-{index}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _retry_after(self, extra=0):
+        ahead = self._queued_total + sum(self._running.values()) + extra
+        return max(1, math.ceil(ahead * self._avg_task_seconds / self.workers))
+
+    def submit_batch(self, user, tasks):
+        """Queue (func, args, kwargs) tasks for a user, all or nothing. Returns their Futures.
+
+        A batch is admitted if it fits within the per-user and global queue limits, or if
+        the respective queue is empty (so oversized batches still make progress alone).
+        Raises QueueFull otherwise.
+        """
+        with self._cond:
+            user_depth = len(self._queues.get(user, ()))
+            if user_depth and user_depth + len(tasks) > self.max_queued_per_user:
+                raise QueueFull(f'{user_depth} file(s) already queued for this user', self._retry_after())
+            if self._queued_total and self._queued_total + len(tasks) > self.max_queued:
+                raise QueueFull('Extraction queue is full', self._retry_after())
+
+            self._ensure_started()
+            queue = self._queues.setdefault(user, deque())
+            futures = []
+            for func, args, kwargs in tasks:
+                future = Future()
+                queue.append((future, func, args, kwargs))
+                futures.append(future)
+            self._queued_total += len(tasks)
+            self._cond.notify(len(tasks))
+            return futures
+
+    def _next_task(self):
+        # Caller holds the lock. Take one task from the user whose turn it is, then move them to the back.
+        user, queue = next(iter(self._queues.items()))
+        task = queue.popleft()
+        if queue:
+            self._queues.move_to_end(user)
+        else:
+            del self._queues[user]
+        self._queued_total -= 1
+        self._running[user] = self._running.get(user, 0) + 1
+        return user, task
+
+    def _work(self):
+        while True:
+            with self._cond:
+                while not self._queues:
+                    self._cond.wait()
+                user, (future, func, args, kwargs) = self._next_task()
+
+            if future.set_running_or_notify_cancel():
+                started = time.perf_counter()
+                try:
+                    future.set_result(func(*args, **kwargs))
+                except BaseException as e:
+                    future.set_exception(e)
+                elapsed = time.perf_counter() - started
+            else:
+                elapsed = None
+
+            with self._cond:
+                self._running[user] -= 1
+                if not self._running[user]:
+                    del self._running[user]
+                if elapsed is not None:
+                    self._avg_task_seconds = 0.9 * self._avg_task_seconds + 0.1 * elapsed
+
+    def snapshot(self):
+        """Queue depth and running task count per user, for the admin dashboard."""
+        with self._cond:
+            return {
+                'workers': self.workers,
+                'queued': {user: len(queue) for user, queue in self._queues.items()},
+                'running': dict(self._running),
+                'total_queued': self._queued_total,
+                'avg_task_seconds': round(self._avg_task_seconds, 3)
+            }
@@ -3,17 +3,24 @@ Web-based PO Extraction Application
 Flask application with authentication, admin dashboard, and PO extraction.
 """
 
+import io
 import os
+import base64
 import uuid
+import time
 import shutil
+import threading
 import json
 import hashlib
 from datetime import datetime
 from functools import wraps
-from flask import Flask, request, jsonify, send_file, session
+from flask import Flask, Request, request, jsonify, send_file, session
 from werkzeug.utils import secure_filename
 
-from po_extractor import extract_po_data, format_excel_output
+from po_extractor import extract_po_data, extraction_error
+from profiling import profiled_call, list_profiles, profile_file_path
+from output_store import store_workbook, find_workbook
+from admission import FairScheduler, QueueFull
 
 import pandas as pd
 
@@ -34,8 +41,15 @@ def after_request(response):
 # Configuration
 IS_VERCEL = os.environ.get('VERCEL') == '1'
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+# All writable state (uploads, outputs, users/activity/sessions) under one folder, e.g. for load tests
+RUNTIME_DIR = os.environ.get('PO_RUNTIME_DIR')
 
-if IS_VERCEL:
+if RUNTIME_DIR:
+    UPLOAD_FOLDER = os.path.join(RUNTIME_DIR, 'uploads')
+    OUTPUT_FOLDER = os.path.join(RUNTIME_DIR, 'outputs')
+    DATA_FOLDER = os.path.join(RUNTIME_DIR, 'data')
+    TEMP_DATA = DATA_FOLDER
+elif IS_VERCEL:
     # On Vercel, we can only write to /tmp
     UPLOAD_FOLDER = os.path.join('/tmp', 'uploads')
     OUTPUT_FOLDER = os.path.join('/tmp', 'outputs')
@@ -51,10 +65,68 @@ else:
 ALLOWED_EXTENSIONS = {'pdf'}
 MAX_CONTENT_LENGTH = 500 * 1024 * 1024
 
+# Extraction memory limits (low-memory mode releases each PDF page after reading it).
+# PO_MAX_RSS_MB is per document: how far process RSS may grow above its value when the
+# document was opened. RSS is process-wide, so with a memory budget set, extractions run one
+# at a time (see EXTRACT_WORKERS) and a neighbouring file's allocations are never charged to it.
+LOW_MEMORY_EXTRACTION = os.environ.get('PO_LOW_MEMORY') == '1'
+MAX_PDF_PAGES = int(os.environ.get('PO_MAX_PAGES', 0)) or None
+MAX_RSS_MB = float(os.environ.get('PO_MAX_RSS_MB', 0)) or None
+
+# OCR of image-only pages (needs pytesseract + Tesseract; skipped with a warning otherwise)
+OCR_ENABLED = os.environ.get('PO_OCR', '1') == '1'
+OCR_WORKERS = int(os.environ.get('PO_OCR_WORKERS', 0)) or None
+
+# Profiling: on for every /api/process call with PO_PROFILE=1, or per request with {"profile": true}.
+# Files slower than the threshold keep a cProfile capture; only the slowest PO_PROFILE_KEEP are kept.
+PROFILE_ALWAYS = os.environ.get('PO_PROFILE') == '1'
+PROFILE_THRESHOLD = float(os.environ.get('PO_PROFILE_THRESHOLD', 2.0))
+PROFILE_KEEP = int(os.environ.get('PO_PROFILE_KEEP', 20))
+
+# Outputs are stored content-addressed in OUTPUT_STORE (identical results share one file);
+# PO_PRECOMPRESS_OUTPUTS=1 also keeps a gzip variant for clients sending Accept-Encoding: gzip
+OUTPUT_STORE = os.path.join(OUTPUT_FOLDER, 'store')
+PRECOMPRESS_OUTPUTS = os.environ.get('PO_PRECOMPRESS_OUTPUTS') == '1'
+
+# Admission control: at most PO_EXTRACT_WORKERS files (default: core count) are extracted at once,
+# taken round-robin across users. /api/process answers 429 when a user's or the global queue is full.
+# With PO_MAX_RSS_MB set there is a single worker, so the per-document RSS budget is meaningful.
+EXTRACT_WORKERS = int(os.environ.get('PO_EXTRACT_WORKERS', 0)) or None
+if MAX_RSS_MB and EXTRACT_WORKERS != 1:
+    if EXTRACT_WORKERS:
+        print(f"Warning: PO_MAX_RSS_MB is set; extracting one file at a time instead of {EXTRACT_WORKERS}")
+    EXTRACT_WORKERS = 1
+MAX_QUEUED_PER_USER = int(os.environ.get('PO_MAX_QUEUED_PER_USER', 500))
+MAX_QUEUED = int(os.environ.get('PO_MAX_QUEUED', 5000))
+
+# In-memory uploads: request bodies up to UPLOAD_SPILL_BYTES are parsed straight into memory
+# and handed to the extractor as buffers; larger requests, or uploads arriving once
+# MAX_BUFFERED_UPLOAD_BYTES is held in memory, spill to UPLOAD_FOLDER as before.
+# Buffers live only in the process that received the upload, so with several worker processes
+# (e.g. gunicorn -w N) /api/process may land elsewhere and not find them. The mode is therefore
+# off when WEB_CONCURRENCY > 1; PO_IN_MEMORY_UPLOADS=0 turns it off for other multi-process
+# setups (uploads then always go to the shared UPLOAD_FOLDER), =1 forces it on.
+_default_in_memory = '0' if int(os.environ.get('WEB_CONCURRENCY', 1)) > 1 else '1'
+IN_MEMORY_UPLOADS = os.environ.get('PO_IN_MEMORY_UPLOADS', _default_in_memory) == '1'
+UPLOAD_SPILL_BYTES = int(os.environ.get('PO_UPLOAD_SPILL_MB', 25)) * 1024 * 1024
+MAX_BUFFERED_UPLOAD_BYTES = int(os.environ.get('PO_MAX_BUFFERED_MB', 200)) * 1024 * 1024
+UPLOAD_BUFFER_TTL = 3600  # Seconds before an unprocessed in-memory session is dropped
+
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['OUTPUT_FOLDER'] = OUTPUT_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = MAX_CONTENT_LENGTH
 
+
+class UploadRequest(Request):
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        # Werkzeug spools every upload over 500KB to a temp file; keep whole small requests in memory
+        if IN_MEMORY_UPLOADS and total_content_length is not None and total_content_length <= UPLOAD_SPILL_BYTES:
+            return io.BytesIO()
+        return super()._get_file_stream(total_content_length, content_type, filename, content_length)
+
+
+app.request_class = UploadRequest
+
 # Ensure writable directories exist
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 os.makedirs(OUTPUT_FOLDER, exist_ok=True)
@@ -74,6 +146,8 @@ else:
 # Activity and Sessions should be in writable location
 ACTIVITY_FILE = os.path.join(TEMP_DATA, 'activity.json')
 SESSIONS_FILE = os.path.join(TEMP_DATA, 'sessions.json')
+OCR_CACHE_FOLDER = os.path.join(TEMP_DATA, 'ocr_cache')
+PROFILE_FOLDER = os.path.join(TEMP_DATA, 'profiles')
 
 # Initialize data files
 def init_data_files():
@@ -141,24 +215,143 @@ def save_json(filepath, data):
 # In-memory session tokens
 active_sessions = {}
 
+# In-memory upload buffers: session_id -> {'created': epoch seconds, 'files': {filename: (BytesIO, size)}}
+upload_buffers = {}
+upload_buffers_lock = threading.Lock()
+
+def take_upload_buffer(file):
+    """Detach and return the BytesIO holding an in-memory upload, or None if it was spooled to disk."""
+    if not isinstance(file.stream, io.BytesIO):
+        return None
+    buffer = file.stream
+    # Flask closes request files on teardown; hand it a placeholder so our buffer survives
+    file.stream = io.BytesIO()
+    buffer.seek(0)
+    return buffer
+
+def buffer_upload(session_id, filename, buffer):
+    """Keep an upload in memory for its session. Returns False if the memory budget is used up."""
+    size = buffer.getbuffer().nbytes
+    with upload_buffers_lock:
+        now = time.time()
+        for stale_id in [sid for sid, entry in upload_buffers.items() if now - entry['created'] > UPLOAD_BUFFER_TTL]:
+            del upload_buffers[stale_id]
+        in_use = sum(size for entry in upload_buffers.values() for _, size in entry['files'].values())
+        if in_use + size > MAX_BUFFERED_UPLOAD_BYTES:
+            return False
+        entry = upload_buffers.setdefault(session_id, {'created': now, 'files': {}})
+        entry['files'][filename] = (buffer, size)
+    return True
+
+def release_session(session_id, buffered, claimed_folder):
+    """Undo process_session's claim on a session that was not admitted."""
+    if buffered is not None:
+        with upload_buffers_lock:
+            # Keep anything a concurrent /upload added to the session meanwhile
+            entry = upload_buffers.setdefault(session_id, buffered)
+            if entry is not buffered:
+                for filename, item in buffered['files'].items():
+                    entry['files'].setdefault(filename, item)
+    if claimed_folder:
+        session_folder = claimed_folder.rsplit('.processing-', 1)[0]
+        try:
+            os.rename(claimed_folder, session_folder)
+        except OSError:
+            # A concurrent /upload recreated the folder: move the claimed files back into it
+            for f in os.listdir(claimed_folder):
+                if not os.path.exists(os.path.join(session_folder, f)):
+                    os.replace(os.path.join(claimed_folder, f), os.path.join(session_folder, f))
+            shutil.rmtree(claimed_folder, ignore_errors=True)
+
+# Shared by every /api/process call; worker threads start on the first admitted batch
+extraction_scheduler = FairScheduler(EXTRACT_WORKERS, MAX_QUEUED_PER_USER, MAX_QUEUED)
+
+def extract_file(filename, source, profile=False, details=None):
+    """Extract one PDF (run on a scheduler worker). Returns (rows, stats, profile_id)."""
+    stats = {}
+    extract_kwargs = {
+        'stats': stats, 'low_memory': LOW_MEMORY_EXTRACTION, 'max_pages': MAX_PDF_PAGES,
+        'max_rss_mb': MAX_RSS_MB, 'ocr': OCR_ENABLED, 'ocr_workers': OCR_WORKERS,
+        'ocr_cache_dir': OCR_CACHE_FOLDER
+    }
+    if profile:
+        rows, _, profile_id = profiled_call(
+            extract_po_data, source, profile_dir=PROFILE_FOLDER, label=filename,
+            threshold=PROFILE_THRESHOLD, keep=PROFILE_KEEP, details=details, **extract_kwargs
+        )
+        return rows, stats, profile_id
+    return extract_po_data(source, **extract_kwargs), stats, None
+
 def generate_token():
     return str(uuid.uuid4())
 
 def hash_password(password):
     return hashlib.sha256(password.encode()).hexdigest()
 
+# Serialises log_activity's read-modify-write, so sequence numbers stay unique
+activity_lock = threading.Lock()
+
+def number_activity(activity):
+    """Give entries logged before sequence numbers existed their list position as 'seq' (in place)."""
+    for index, entry in enumerate(activity):
+        entry.setdefault('seq', index)
+    return activity
+
 def log_activity(username, action, details=None):
-    activity = load_json(ACTIVITY_FILE)
-    activity.append({
-        'id': str(uuid.uuid4()),
-        'username': username,
-        'action': action,
-        'details': details or {},
-        'timestamp': datetime.now().isoformat()
-    })
-    # Keep last 1000 activities
-    activity = activity[-1000:]
-    save_json(ACTIVITY_FILE, activity)
+    with activity_lock:
+        activity = number_activity(load_json(ACTIVITY_FILE))
+        activity.append({
+            'id': str(uuid.uuid4()),
+            'seq': activity[-1]['seq'] + 1 if activity else 0,
+            'username': username,
+            'action': action,
+            'details': details or {},
+            'timestamp': datetime.now().isoformat()
+        })
+        # Keep last 1000 activities (this cap also bounds the cost of reading the log per request)
+        activity = activity[-1000:]
+        save_json(ACTIVITY_FILE, activity)
+
+MAX_ACTIVITY_PAGE = 200
+
+def encode_activity_cursor(entry):
+    return base64.urlsafe_b64encode(f"seq:{entry['seq']}".encode()).decode()
+
+def decode_activity_cursor(cursor):
+    """Return the sequence number encoded in a cursor. Raises ValueError if malformed."""
+    try:
+        prefix, seq = base64.urlsafe_b64decode(cursor.encode()).decode().split(':', 1)
+        if prefix != 'seq':
+            raise ValueError
+        return int(seq)
+    except Exception:
+        raise ValueError('Invalid cursor')
+
+def query_activity(activity, limit, before=None, usernames=None, actions=None, since=None, until=None):
+    """Newest-first page of matching activities logged before sequence number `before`.
+
+    The activity log is append-ordered and 'seq' increases with it (unlike timestamps,
+    which can tie), so it is walked backwards and the scan stops as soon as limit + 1
+    matches are found; no full sort. Entries must be numbered (number_activity).
+    Returns (page, has_more).
+    """
+    page = []
+    for entry in reversed(activity):
+        if before is not None and entry['seq'] >= before:
+            continue
+        if until and entry['timestamp'] > until:
+            continue
+        if since and entry['timestamp'] < since:
+            # Older entries cannot match either
+            break
+        if usernames and entry['username'] not in usernames:
+            continue
+        if actions and entry['action'] not in actions:
+            continue
+        page.append(entry)
+        if len(page) > limit:
+            break
+    return page[:limit], len(page) > limit
 
 def get_user_from_token(token):
     if token in active_sessions:
@@ -326,7 +519,8 @@ def get_admin_stats():
         'total_files_processed': total_files,
         'today_logins': today_logins,
         'today_uploads': today_uploads,
-        'user_stats': user_stats
+        'user_stats': user_stats,
+        'extraction_queue': extraction_scheduler.snapshot()
     })
 
 @app.route('/api/admin/activity', methods=['GET', 'OPTIONS'])
@@ -335,13 +529,30 @@ def get_activity_log():
     if request.method == 'OPTIONS':
         return '', 204
     
-    activity = load_json(ACTIVITY_FILE)
-    limit = request.args.get('limit', 50, type=int)
-    
-    # Return most recent activities
-    recent = sorted(activity, key=lambda x: x['timestamp'], reverse=True)[:limit]
+    # Keyset pagination: pass back next_cursor as ?cursor= to page further back.
+    # Filters: username and action (comma-separated), since/until (ISO timestamps).
+    limit = min(max(request.args.get('limit', 50, type=int), 1), MAX_ACTIVITY_PAGE)
+    before = None
+    if request.args.get('cursor'):
+        try:
+            before = decode_activity_cursor(request.args['cursor'])
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+    usernames = set(filter(None, request.args.get('username', '').split(',')))
+    actions = set(filter(None, request.args.get('action', '').split(',')))
+    
+    # The whole log is parsed per request; log_activity's 1000-entry cap is what bounds this
+    activity = number_activity(load_json(ACTIVITY_FILE))
+    page, has_more = query_activity(
+        activity, limit, before, usernames, actions,
+        request.args.get('since'), request.args.get('until')
+    )
     
-    return jsonify({'activities': recent})
+    return jsonify({
+        'activities': page,
+        'has_more': has_more,
+        'next_cursor': encode_activity_cursor(page[-1]) if has_more else None
+    })
 
 @app.route('/api/admin/users', methods=['GET', 'OPTIONS'])
 @require_admin
@@ -373,6 +584,37 @@ def get_users():
     
     return jsonify({'users': user_list})
 
+@app.route('/api/admin/profiles', methods=['GET', 'OPTIONS'])
+@require_admin
+def get_profiles():
+    if request.method == 'OPTIONS':
+        return '', 204
+    
+    # Slowest first; bounded by PROFILE_KEEP
+    return jsonify({
+        'profiles': list_profiles(PROFILE_FOLDER),
+        'threshold_seconds': PROFILE_THRESHOLD,
+        'keep': PROFILE_KEEP
+    })
+
+@app.route('/api/admin/profiles/<profile_id>', methods=['GET'])
+@require_admin
+def download_profile(profile_id):
+    # format=prof (pstats data, default) or format=txt (cumulative-time report)
+    fmt = request.args.get('format', 'prof')
+    filepath = profile_file_path(PROFILE_FOLDER, profile_id, fmt)
+    if not filepath:
+        return jsonify({'error': 'Profile not found'}), 404
+    
+    log_activity(request.current_user['username'], 'profile_download', {'profile_id': profile_id})
+    
+    return send_file(
+        filepath,
+        as_attachment=True,
+        download_name=f'{profile_id}.{fmt}',
+        mimetype='text/plain' if fmt == 'txt' else 'application/octet-stream'
+    )
+
 # ============== PO EXTRACTION ENDPOINTS ==============
 
 @app.route('/')
@@ -397,12 +639,15 @@ def upload_files():
         session_id = str(uuid.uuid4())
     
     session_folder = os.path.join(app.config['UPLOAD_FOLDER'], session_id)
-    os.makedirs(session_folder, exist_ok=True)
+    if IN_MEMORY_UPLOADS:
+        with upload_buffers_lock:
+            upload_buffers.setdefault(session_id, {'created': time.time(), 'files': {}})
     
     files = request.files.getlist('files[]')
     
     # Valid files tracking
     saved_count = 0
+    buffered_count = 0
     errors = []
     
     if not files or all(f.filename == '' for f in files):
@@ -422,7 +667,19 @@ def upload_files():
             filepath = os.path.join(session_folder, filename)
             
             try:
-                file.save(filepath)
+                buffer = take_upload_buffer(file) if IN_MEMORY_UPLOADS else None
+                if buffer is not None and buffer_upload(session_id, filename, buffer):
+                    buffered_count += 1
+                else:
+                    # Spill to disk: request too large for memory, or buffer budget used up
+                    with upload_buffers_lock:
+                        upload_buffers.get(session_id, {}).get('files', {}).pop(filename, None)
+                    os.makedirs(session_folder, exist_ok=True)
+                    if buffer is not None:
+                        with open(filepath, 'wb') as f:
+                            f.write(buffer.getbuffer())
+                    else:
+                        file.save(filepath)
                 saved_count += 1
             except Exception as e:
                 errors.append({
@@ -439,6 +696,7 @@ def upload_files():
     return jsonify({
         'session_id': session_id,
         'saved': saved_count,
+        'in_memory': buffered_count,
         'errors': errors
     })
 
@@ -451,13 +709,49 @@ def process_session():
         
     data = request.get_json()
     session_id = data.get('session_id')
+    profile = PROFILE_ALWAYS or bool(data.get('profile'))
     
     if not session_id:
         return jsonify({'error': 'Session ID required'}), 400
         
+    # Claim the session atomically (buffers popped, folder renamed), so a double-click or
+    # client retry cannot queue the same BytesIO twice for concurrent reads
     session_folder = os.path.join(app.config['UPLOAD_FOLDER'], session_id)
-    if not os.path.exists(session_folder):
+    claimed_folder = f'{session_folder}.processing-{uuid.uuid4().hex}'
+    with upload_buffers_lock:
+        buffered = upload_buffers.pop(session_id, None)
+    try:
+        os.rename(session_folder, claimed_folder)
+    except OSError:
+        claimed_folder = None
+    if buffered is None and claimed_folder is None:
         return jsonify({'error': 'Session not found or expired'}), 404
+    
+    # In-memory buffers first, then any files that spilled to the folder
+    pdf_sources = []
+    if buffered:
+        pdf_sources = [(filename, buffer) for filename, (buffer, _) in buffered['files'].items()]
+    if claimed_folder:
+        in_memory_names = {filename for filename, _ in pdf_sources}
+        pdf_sources += [
+            (f, os.path.join(claimed_folder, f)) for f in os.listdir(claimed_folder)
+            if f.lower().endswith('.pdf') and f not in in_memory_names
+        ]
+    # Stable order, so identical batches produce identical (deduplicated) outputs
+    pdf_sources.sort(key=lambda item: item[0])
+    
+    # Queue every file up front; if the batch is not admitted the session is put back for a retry
+    username = request.current_user['username']
+    details = {'username': username, 'session_id': session_id}
+    try:
+        futures = extraction_scheduler.submit_batch(username, [
+            (extract_file, (filename, source, profile, details), {}) for filename, source in pdf_sources
+        ])
+    except QueueFull as e:
+        release_session(session_id, buffered, claimed_folder)
+        response = jsonify({'error': f'Server busy: {e}. Please retry shortly.', 'retry_after': e.retry_after})
+        response.headers['Retry-After'] = str(e.retry_after)
+        return response, 429
         
     results = {
         'session_id': session_id,
@@ -469,17 +763,18 @@ def process_session():
     }
     
     try:
-        # 1. Process all files in the folder
-        # We need to list valid PDFs in the folder
-        pdf_files = [f for f in os.listdir(session_folder) if f.lower().endswith('.pdf')]
-        results['total_files'] = len(pdf_files)
+        # 1. Collect results in filename order as the scheduler's workers finish them
+        results['total_files'] = len(pdf_sources)
         
         all_data = []
         
-        for filename in pdf_files:
-            filepath = os.path.join(session_folder, filename)
+        for (filename, _), future in zip(pdf_sources, futures):
             try:
-                rows = extract_po_data(filepath)
+                rows, stats, profile_id = future.result()
+                error = extraction_error(rows, stats)
+                if error:
+                    results['errors'].append({'filename': filename, 'error': error})
+                    continue
                 first = rows[0] if rows else {}
                 for row in rows:
                     row['SOURCE_FILE'] = filename
@@ -494,7 +789,14 @@ def process_session():
                     'article': article_summary,
                     'total_pcs': first.get('TOTAL PCS', 'N/A') if len(rows) == 1 else f"{len(rows)} lines",
                     'basic_price': first.get('BASIC PRICE WITHOUT TAX', 'N/A'),
-                    'total_value': first.get('TOTAL BASIC PO VALUE WITHOUT TAX', 'N/A')
+                    'total_value': first.get('TOTAL BASIC PO VALUE WITHOUT TAX', 'N/A'),
+                    'layout': stats['layout'],
+                    'classify_ms': round(stats['classify_seconds'] * 1000, 1),
+                    'pages': stats['pages'],
+                    'peak_rss_mb': round(stats['peak_rss_mb'], 1) if stats['peak_rss_mb'] is not None else None,
+                    'ocr_pages': stats['ocr_pages'],
+                    'ocr_ms': round(stats['ocr_seconds'] * 1000, 1),
+                    'profile_id': profile_id
                 })
                 results['successful'] += 1
                 
@@ -516,19 +818,15 @@ def process_session():
             
             timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
             output_filename = f'PO_Extracted_{timestamp}.xlsx'
-            output_path = os.path.join(app.config['OUTPUT_FOLDER'], f'{session_id}_{output_filename}')
-            
-            df.to_excel(output_path, index=False, sheet_name='PO Data')
-            format_excel_output(output_path)
+            digest, _ = store_workbook(OUTPUT_STORE, df, PRECOMPRESS_OUTPUTS)
             
-            results['excel_file'] = f'{session_id}_{output_filename}'
+            # "<digest>_<download name>": the digest locates the stored workbook and is its ETag
+            results['excel_file'] = f'{digest}_{output_filename}'
             results['download_ready'] = True
             
         # 3. Cleanup
-        try:
-            shutil.rmtree(session_folder)
-        except:
-            pass
+        if claimed_folder:
+            shutil.rmtree(claimed_folder, ignore_errors=True)
             
         return jsonify(results)
 
@@ -538,21 +836,43 @@ def process_session():
 @app.route('/download/<filename>')
 @require_auth
 def download_file(filename):
-    filepath = os.path.join(app.config['OUTPUT_FOLDER'], filename)
-    
-    if not os.path.exists(filepath):
-        return jsonify({'error': 'File not found'}), 404
-    
     original_name = '_'.join(filename.split('_')[1:]) if '_' in filename else filename
-    
-    log_activity(request.current_user['username'], 'download', {'filename': original_name})
-    
-    return send_file(
-        filepath,
+    digest = filename.split('_')[0]
+    
+    filepath, gz_path = find_workbook(OUTPUT_STORE, digest)
+    etag = digest
+    if not filepath:
+        # Files written before outputs were content-addressed
+        filepath = os.path.join(app.config['OUTPUT_FOLDER'], secure_filename(filename))
+        etag = True
+        if not os.path.exists(filepath):
+            return jsonify({'error': 'File not found'}), 404
+    
+    # Serve the gzip variant to clients that accept it (not for Range requests, which address the xlsx bytes)
+    # (accept_encodings honours q-values, so "gzip;q=0" opts out)
+    use_gzip = gz_path and request.accept_encodings['gzip'] > 0 and 'Range' not in request.headers
+    
+    # send_file answers If-None-Match with 304 and Range with 206 from the strong ETag
+    response = send_file(
+        gz_path if use_gzip else filepath,
         as_attachment=True,
         download_name=original_name,
-        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+        etag=f'{etag}-gzip' if use_gzip else etag,
+        conditional=True
     )
+    if use_gzip:
+        response.headers['Content-Encoding'] = 'gzip'
+    if etag is not True:
+        # Content-addressed: the bytes behind this URL never change (private: downloads need auth)
+        response.headers['Cache-Control'] = 'private, max-age=31536000, immutable'
+        response.headers['Vary'] = 'Accept-Encoding'
+    
+    # Only complete downloads count; a resumed download's 206 Range responses would log it many times
+    if response.status_code == 200:
+        log_activity(request.current_user['username'], 'download', {'filename': original_name})
+    
+    return response
 
 @app.route('/health')
 def health_check():
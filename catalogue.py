@@ -0,0 +1,72 @@
+"""
+SKU Catalogue
+Loads the SKU master (EAN -> canonical name, brand, pack size, expected price)
+into an EAN-keyed index used to filter and enrich PO article lines.
+"""
+
+import os
+import csv
+
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_CATALOGUE_PATH = os.path.join(BASE_DIR, 'data', 'sku_master.csv')
+
+CATALOGUE_FIELDS = ['ean', 'name', 'brand', 'vendor', 'pack_size', 'expected_price']
+
+_default_catalogue = None
+
+
+def load_catalogue(path=None):
+    """Load the SKU master CSV into a dict keyed by 13-digit EAN."""
+    path = path or DEFAULT_CATALOGUE_PATH
+    catalogue = {}
+    with open(path, 'r', newline='', encoding='utf-8-sig') as f:
+        for record in csv.DictReader(f):
+            ean = (record.get('ean') or '').strip()
+            if not ean:
+                continue
+            catalogue[ean] = {field: (record.get(field) or '').strip() for field in CATALOGUE_FIELDS}
+    return catalogue
+
+
+class CatalogueError(Exception):
+    """Raised when the default SKU catalogue is missing, unreadable or empty."""
+
+
+def get_default_catalogue():
+    """Return the catalogue loaded from DEFAULT_CATALOGUE_PATH (loaded once per process).
+
+    Raises CatalogueError rather than falling back to an empty catalogue, which would
+    silently drop every article line. Failures are not cached; the next call retries.
+    """
+    global _default_catalogue
+    if _default_catalogue is None:
+        try:
+            catalogue = load_catalogue()
+        except (OSError, ValueError, csv.Error) as e:
+            raise CatalogueError(f"Could not load SKU catalogue {DEFAULT_CATALOGUE_PATH}: {str(e)}") from e
+        if not catalogue:
+            raise CatalogueError(f"SKU catalogue {DEFAULT_CATALOGUE_PATH} lists no EANs")
+        _default_catalogue = catalogue
+    return _default_catalogue
+
+
+def filter_catalogue(catalogue, brands=None, vendors=None):
+    """Return a sub-catalogue restricted to the given brands and/or vendors (case-insensitive)."""
+    brand_set = {b.lower() for b in brands} if brands else None
+    vendor_set = {v.lower() for v in vendors} if vendors else None
+    return {
+        ean: entry for ean, entry in catalogue.items()
+        if (brand_set is None or entry['brand'].lower() in brand_set)
+        and (vendor_set is None or entry['vendor'].lower() in vendor_set)
+    }
+
+
+def enrich_row(row, entry):
+    """Copy catalogue data for a matched EAN onto an extracted row."""
+    row['EAN'] = entry['ean']
+    row['CATALOGUE NAME'] = entry['name']
+    row['BRAND'] = entry['brand']
+    row['PACK SIZE'] = entry['pack_size']
+    row['EXPECTED PRICE'] = entry['expected_price']
+    return row
@@ -0,0 +1,235 @@
+"""
+Distributed PO Folder Processing
+Several CLI instances (nodes) process one archive folder together, coordinating
+through a SQLite manifest on a shared path. Nodes claim batches of files under a
+time-limited lease, write partial outputs next to the manifest and mark the files
+done; files leased by a node that dies are reclaimed once the lease expires.
+A final merge step builds the consolidated Excel output from the partials.
+
+Example (each line can run on a different machine, or as local processes):
+    python po_extractor.py -i archive --manifest /shared/po.sqlite --node-id node1
+    python po_extractor.py -i archive --manifest /shared/po.sqlite --node-id node2
+    python po_extractor.py -i archive --manifest /shared/po.sqlite --merge -o audit.xlsx
+"""
+
+import os
+import json
+import time
+import socket
+import sqlite3
+
+import pandas as pd
+
+from po_extractor import extract_po_data, extraction_error, find_pdf_files, format_excel_output
+
+
+LEASE_SECONDS = 600
+BATCH_SIZE = 20
+MAX_ATTEMPTS = 3
+
+
+def default_node_id():
+    return f'{socket.gethostname()}-{os.getpid()}'
+
+
+def partials_folder(manifest_path):
+    """Folder beside the manifest holding each node's partial outputs."""
+    return f'{manifest_path}.parts'
+
+
+def _connect(manifest_path):
+    # Autocommit mode: transactions are opened explicitly with BEGIN IMMEDIATE
+    conn = sqlite3.connect(manifest_path, timeout=60, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def init_manifest(manifest_path, input_folder):
+    """Create the manifest if needed and add any PDFs not yet listed. Returns the number added.
+
+    Files are stored relative to input_folder, so nodes may mount the archive at different paths.
+    """
+    pdf_files = sorted(os.path.relpath(path, input_folder) for path in find_pdf_files(input_folder))
+    conn = _connect(manifest_path)
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY,
+                status TEXT NOT NULL DEFAULT 'pending',
+                node TEXT,
+                lease_expires REAL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                output TEXT,
+                error TEXT,
+                updated REAL
+            )
+        """)
+        before = conn.execute('SELECT COUNT(*) FROM files').fetchone()[0]
+        conn.executemany(
+            "INSERT OR IGNORE INTO files (path, updated) VALUES (?, ?)",
+            [(path, time.time()) for path in pdf_files]
+        )
+        added = conn.execute('SELECT COUNT(*) FROM files').fetchone()[0] - before
+        conn.execute('COMMIT')
+    finally:
+        conn.close()
+    os.makedirs(partials_folder(manifest_path), exist_ok=True)
+    return added
+
+
+def claim_batch(conn, node_id, batch_size=BATCH_SIZE, lease_seconds=LEASE_SECONDS, max_attempts=MAX_ATTEMPTS):
+    """Lease up to batch_size pending (or expired) files to this node. Returns their paths."""
+    now = time.time()
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        # Files whose lease lapsed max_attempts times are assumed to crash nodes
+        conn.execute("""
+            UPDATE files SET status = 'failed', error = 'Lease expired too many times', updated = ?
+            WHERE status = 'claimed' AND lease_expires < ? AND attempts >= ?
+        """, (now, now, max_attempts))
+        paths = [row['path'] for row in conn.execute("""
+            SELECT path FROM files
+            WHERE status = 'pending' OR (status = 'claimed' AND lease_expires < ?)
+            ORDER BY path LIMIT ?
+        """, (now, batch_size))]
+        conn.executemany("""
+            UPDATE files SET status = 'claimed', node = ?, lease_expires = ?, attempts = attempts + 1, updated = ?
+            WHERE path = ?
+        """, [(node_id, now + lease_seconds, now, path) for path in paths])
+        conn.execute('COMMIT')
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+    return paths
+
+
+def renew_lease(conn, node_id, paths, lease_seconds=LEASE_SECONDS):
+    """Extend this node's lease on files it still holds."""
+    now = time.time()
+    conn.executemany("""
+        UPDATE files SET lease_expires = ?, updated = ?
+        WHERE path = ? AND node = ? AND status = 'claimed'
+    """, [(now + lease_seconds, now, path, node_id) for path in paths])
+
+
+def complete_batch(conn, node_id, output_name, outcomes):
+    """Mark files done (or failed) if this node still holds them. Returns the number recorded.
+
+    outcomes maps path -> error message (None on success).
+    """
+    now = time.time()
+    recorded = 0
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        for path, error in outcomes.items():
+            cursor = conn.execute("""
+                UPDATE files SET status = ?, output = ?, error = ?, lease_expires = NULL, updated = ?
+                WHERE path = ? AND node = ? AND status = 'claimed'
+            """, ('failed' if error else 'done', output_name, error, now, path, node_id))
+            recorded += cursor.rowcount
+        conn.execute('COMMIT')
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+    return recorded
+
+
+def run_node(manifest_path, input_folder, node_id=None, batch_size=BATCH_SIZE,
+             lease_seconds=LEASE_SECONDS, **extract_kwargs):
+    """Claim and process batches until no claimable files remain. Returns files processed.
+
+    extract_kwargs are passed through to extract_po_data.
+    """
+    node_id = node_id or default_node_id()
+    parts = partials_folder(manifest_path)
+    os.makedirs(parts, exist_ok=True)
+    processed = 0
+    batch_number = 0
+    conn = _connect(manifest_path)
+    try:
+        while True:
+            paths = claim_batch(conn, node_id, batch_size, lease_seconds)
+            if not paths:
+                break
+            batch_number += 1
+            print(f"[{node_id}] Claimed {len(paths)} file(s)")
+
+            results = {}
+            outcomes = {}
+            for path in paths:
+                stats = {}
+                try:
+                    rows = extract_po_data(os.path.join(input_folder, path), stats=stats, **extract_kwargs)
+                    # Unreadable, unrecognised and over-budget files are failures, not blank rows
+                    outcomes[path] = extraction_error(rows, stats)
+                    if outcomes[path] is None:
+                        results[path] = rows
+                except Exception as e:
+                    outcomes[path] = str(e)
+                # Finished files stay leased too, until complete_batch records them
+                renew_lease(conn, node_id, paths, lease_seconds)
+
+            # Write the partial atomically; only files this node still holds point at it
+            output_name = f'{node_id}_{int(time.time() * 1000)}_{batch_number}.json'
+            tmp_path = os.path.join(parts, output_name + '.tmp')
+            with open(tmp_path, 'w') as f:
+                json.dump(results, f)
+            os.replace(tmp_path, os.path.join(parts, output_name))
+
+            recorded = complete_batch(conn, node_id, output_name, outcomes)
+            if recorded < len(paths):
+                print(f"[{node_id}] Lease lost on {len(paths) - recorded} file(s); another node will redo them")
+            processed += recorded
+    finally:
+        conn.close()
+    print(f"[{node_id}] Done: {processed} file(s) processed")
+    return processed
+
+
+def manifest_status(manifest_path):
+    """Return a {status: count} summary of the manifest."""
+    conn = _connect(manifest_path)
+    try:
+        return {row['status']: row['n'] for row in conn.execute(
+            'SELECT status, COUNT(*) AS n FROM files GROUP BY status'
+        )}
+    finally:
+        conn.close()
+
+
+def merge_manifest(manifest_path, output_file, allow_incomplete=False):
+    """Merge partial outputs of all done files into one Excel file. Returns output_file or None."""
+    status = manifest_status(manifest_path)
+    outstanding = status.get('pending', 0) + status.get('claimed', 0)
+    if outstanding and not allow_incomplete:
+        print(f"Cannot merge: {outstanding} file(s) still pending or claimed ({status})")
+        return None
+
+    conn = _connect(manifest_path)
+    try:
+        done = conn.execute(
+            "SELECT path, output FROM files WHERE status = 'done' ORDER BY path"
+        ).fetchall()
+        failed = conn.execute("SELECT path, error FROM files WHERE status = 'failed'").fetchall()
+    finally:
+        conn.close()
+
+    # Each partial is read once; rows from superseded partials (lost leases) are ignored
+    parts = partials_folder(manifest_path)
+    loaded = {}
+    all_data = []
+    for row in done:
+        if row['output'] not in loaded:
+            with open(os.path.join(parts, row['output'])) as f:
+                loaded[row['output']] = json.load(f)
+        all_data.extend(loaded[row['output']][row['path']])
+
+    for row in failed:
+        print(f"Failed: {row['path']} ({row['error']})")
+
+    df = pd.DataFrame(all_data)
+    df.to_excel(output_file, index=False, sheet_name='PO Data')
+    format_excel_output(output_file)
+    print(f"\nMerged {len(done)} file(s) into: {output_file}")
+    return output_file
@@ -8,6 +8,9 @@ import AdminDashboard from './components/AdminDashboard'
 import './App.css'
 
 const API_BASE = ''
+// /api/process answers 429 with retry_after while the extraction queue is full
+const MAX_PROCESS_ATTEMPTS = 10
+const MAX_PROCESS_WAIT_SECONDS = 300
 
 // Icons
 const FileTextIcon = () => (
@@ -198,14 +201,30 @@ function App() {
       setProgressText('Extracting data and generating Excel...')
       setProgress(75)
 
-      const processRes = await fetch(`${API_BASE}/api/process`, {
-        method: 'POST',
-        headers: {
-          'Content-Type': 'application/json',
-          'X-User-Token': token
-        },
-        body: JSON.stringify({ session_id: sessionId })
-      })
+      let processRes
+      let waited = 0
+      for (let attempt = 1; ; attempt++) {
+        processRes = await fetch(`${API_BASE}/api/process`, {
+          method: 'POST',
+          headers: {
+            'Content-Type': 'application/json',
+            'X-User-Token': token
+          },
+          body: JSON.stringify({ session_id: sessionId })
+        })
+        if (processRes.status !== 429) break
+
+        // Server queue is full; the upload is kept, so wait as suggested and retry (within limits)
+        const busy = await processRes.json().catch(() => ({}))
+        const wait = busy.retry_after || 5
+        if (attempt >= MAX_PROCESS_ATTEMPTS || waited + wait > MAX_PROCESS_WAIT_SECONDS) {
+          throw new Error(busy.error || 'Server busy, please try again later')
+        }
+        setProgressText(`Server busy, retrying in ${wait}s...`)
+        await new Promise(resolve => setTimeout(resolve, wait * 1000))
+        waited += wait
+        setProgressText('Extracting data and generating Excel...')
+      }
 
       if (!processRes.ok) {
         const errorData = await processRes.json().catch(() => ({}))
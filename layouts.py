@@ -0,0 +1,148 @@
+"""
+PO Layout Registry
+Each retail chain's PO layout declares its fingerprint, header field rules and
+article table rules. A cheap fingerprint check on the PDF metadata and first-page
+text picks the layout, so extraction never blind-retries other chains' regexes.
+"""
+
+import re
+
+
+# Registered layouts, checked in registration order
+LAYOUTS = []
+
+
+def register_layout(layout):
+    """Add a layout to the registry, precompiling its fingerprint and field patterns."""
+    fingerprint = layout.setdefault('fingerprint', {})
+    fingerprint['metadata_regexes'] = {
+        key: re.compile(pattern) for key, pattern in fingerprint.get('metadata', {}).items()
+    }
+    for rule in layout['fields']:
+        rule['regexes'] = [re.compile(pattern, rule.get('flags', 0)) for pattern in rule['patterns']]
+    LAYOUTS.append(layout)
+    return layout
+
+
+def _matches_fingerprint(layout, first_page_text, metadata):
+    fingerprint = layout['fingerprint']
+    # Metadata is free to check (no layout analysis), so a match there is enough on its own
+    for key, regex in fingerprint['metadata_regexes'].items():
+        value = metadata.get(key)
+        if isinstance(value, str) and regex.search(value):
+            return True
+    markers = fingerprint.get('text', [])
+    return bool(markers) and all(marker in first_page_text for marker in markers)
+
+
+def classify_layout(first_page_text, metadata=None):
+    """Return the layout whose fingerprint matches, or None for an unknown layout."""
+    metadata = metadata or {}
+    for layout in LAYOUTS:
+        if _matches_fingerprint(layout, first_page_text or '', metadata):
+            return layout
+    return None
+
+
+# ============== DMART (AVENUE SUPERMARTS) ==============
+
+def _dmart_site_code(block):
+    """Build the site code / address from the DMart 'Ship To' block."""
+    block = re.sub(r'Avenue Supermarts Ltd\.?', '', block)
+    block = re.sub(r'PO\s*#\s*\d+', '', block)
+    block = re.sub(r'PO\s*Date\s*[\d.]+', '', block)
+    block = re.sub(r'Delivery\s*Dt?\s*[\d.]+', '', block)
+    block = re.sub(r'\n', ' ', block)
+    block = re.sub(r'\s+', ' ', block).strip()
+    parts = []
+    dmart_match = re.search(r'([A-Za-z\s]+(?:DMart|Dmart|DMART))', block)
+    if dmart_match:
+        parts.append(dmart_match.group(1).strip())
+        block = block.replace(dmart_match.group(1), '')
+    addr_parts = re.findall(r'([A-Za-z][A-Za-z\s,]+?)(?=\s+[A-Z][a-z]+\s+\d{6}|\s*$)', block)
+    for part in addr_parts:
+        cleaned = part.strip(' ,')
+        if cleaned and cleaned not in parts:
+            parts.append(cleaned)
+    city_pin = re.search(r'([A-Z][a-z]+)\s+(\d{6})', block)
+    if city_pin:
+        parts.append(f"{city_pin.group(1)} - {city_pin.group(2)}")
+    site_code = ', '.join(parts)
+    site_code = re.sub(r',\s*,', ',', site_code)
+    return re.sub(r'\s+', ' ', site_code).strip(' ,')
+
+
+DMART_LAYOUT = register_layout({
+    'name': 'dmart',
+    'fingerprint': {
+        # Document number in the print title, e.g. 10028053/DMP0000445270_1
+        'metadata': {'Title': r'/DMP\d+'},
+        'text': ['PURCHASE ORDER', 'Avenue Supermarts', 'EAN No'],
+    },
+    # Low-memory mode: pages are cropped to these fractional (x0, top, x1, bottom) regions,
+    # i.e. header and article table without the "Page n/m" footer band
+    'crop': {
+        'first_page': (0, 0, 1, 0.93),
+        'pages': (0, 0, 1, 0.93),
+    },
+    # Low-memory mode stops reading pages once the article table has ended
+    'end_marker': 'Amount in words',
+    # Header fields: first matching pattern wins; transform is a name understood by
+    # po_extractor (strip, date, state) or a callable taking the captured group
+    'fields': [
+        {'column': 'CHAINS', 'patterns': [r'Ship To\s+([\w\s]+Ltd\.?)'], 'transform': 'strip'},
+        {'column': 'SITE CODE', 'patterns': [r'Ship To\s+(.*?)CIN:'], 'flags': re.DOTALL,
+         'transform': _dmart_site_code},
+        {'column': 'PO NO', 'patterns': [r'PO\s*#\s*(\d+)']},
+        {'column': 'PO DATE', 'patterns': [r'PO\s*Date\s*(\d{2}[./]\d{2}[./]\d{4})'], 'transform': 'date'},
+        {'column': 'DELIVERY DATE', 'patterns': [r'Delivery\s*Dt?\s*(\d{2}[./]\d{2}[./]\d{4})'],
+         'transform': 'date'},
+        {'column': 'VENDOR NAME', 'patterns': [
+            r'Vendor\s+([\w\s]+?)(?=\s+GSTIN|\s+Phone|\s+FSSAI|Email)',
+            r'Phone\s+Vendor\s+([\w\s]+?)(?=\s+GSTIN|Email|\n)',
+        ], 'transform': 'strip'},
+        # State from GSTIN (store/ship-to location)
+        {'column': 'STATE', 'patterns': [r'GSTIN[:\s]*(\d{2}[A-Z0-9]+)'], 'transform': 'state'},
+        # Vendor code: do not use GST number. Look for explicit "Vendor Code" in PDF if present.
+        {'column': 'VENDOR CODE', 'patterns': [r'Vendor\s*Code\s*[:\s]*([A-Za-z0-9\-]+)'],
+         'flags': re.IGNORECASE, 'transform': 'strip'},
+    ],
+    'table': {
+        # Cheap EAN scan: candidate lines are looked up in the catalogue before the row regex runs
+        'ean_regex': re.compile(r'(?<!\d)(\d{13})\s'),
+        # Article description: capture full text including weight in brackets e.g. SHAREAT FOOCHKA PANI PURI(1KG)
+        # Lookahead (?=...\s+\d) ensures we only end at UOM when followed by quantity (not "KG" inside "(1KG)")
+        'row_regex': re.compile(
+            r'(\d{13})\s+'  # EAN (13 digits)
+            r'([\w\s\(\)\-/]+?)\s*'  # Article description (incl. weight like (1KG))
+            r'(?=(?:EA|PC|KG|LT|MT)\s+\d)'  # End only when UOM is followed by quantity
+            r'(?:EA|PC|KG|LT|MT)\s+'  # Unit of measure
+            r'(\d+)\s+'  # Quantity
+            r'\d+\s+'  # Free
+            r'[\d.]+\s+'  # Basic Price (B.Price)
+            r'[\d.]+\s+'  # Special Discount
+            r'[\d.]+\s+'  # Schedule Value
+            r'[\d.]+\s+'  # SGST
+            r'[\d.]+\s+'  # CGST
+            r'[\d.]+\s+'  # Cess
+            r'([\d.]+)\s+'  # Landing Price (L.Price)
+            r'[\d.]+\s+'  # MRP
+            r'([\d,]+\.?\d*)',  # Total Value
+            re.MULTILINE
+        ),
+        'groups': {'ean': 1, 'description': 2, 'quantity': 3, 'price': 4, 'total': 5},
+        # Weight continuation on next line e.g. "PURI(1KG)" or "PANIPURI(200G)" after "SHAREAT FOOCHKA PANI"
+        'continuation_regex': re.compile(
+            r'\n\s*([A-Za-z]*\s*\(\d+(?:\.\d+)?\s*(?:KG|G|ML|LT)\))\s*\[?',
+            re.IGNORECASE
+        ),
+        # Fallback: single-article extraction with simpler patterns when no row matches
+        'fallback': {
+            'article_regex': re.compile(
+                r'(\d{13})\s+([\w\s\(\)\-/]+?)(?:\s*\[HSN|\s+EA\s+|\s+PC\s+|\s+KG\s+)'
+            ),
+            'quantity_regex': re.compile(r'(?:EA|PC|KG|LT|MT)\s+(\d+)\s+\d+\s+([\d.]+)'),
+            'total_regex': re.compile(r'Total\s+(\d+)\s+([\d,]+\.?\d*)'),
+        },
+    },
+})
@@ -0,0 +1,409 @@
+"""
+Load Test for the PO Extraction API
+Drives the real /api/auth/login -> /upload -> /api/process -> /download flow with
+concurrent scripted user sessions and synthetic DMart PO PDFs, against a locally
+started app.py server (or --url). Reports p50/p95/p99 latency, throughput and error
+rate per endpoint, and records the results as JSON for comparison over time.
+
+The local server runs against a throwaway PO_RUNTIME_DIR, so a run leaves no users,
+activity or outputs behind in data/ and outputs/; its log is kept next to the results.
+Each scripted user logs in as its own account (created in the throwaway users file),
+so per-user state, queues and round-robin scheduling are exercised as in production.
+Against --url, pass the accounts with --account (scripted users cycle through them).
+
+Usage:
+    python loadtest.py --users 50 --sessions 2 --files 5
+    python loadtest.py --url http://localhost:5000 --users 10 --account alice:pw1 --account bob:pw2
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import hashlib
+import uuid
+import random
+import shutil
+import socket
+import argparse
+import tempfile
+import threading
+import subprocess
+import urllib.error
+import urllib.request
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+RESULTS_FOLDER = os.path.join(BASE_DIR, 'loadtest_results')
+
+# Like the frontend: a 429 from /api/process is retried after its retry_after, within limits
+MAX_PROCESS_ATTEMPTS = 10
+MAX_PROCESS_WAIT_SECONDS = 300
+
+# (EAN, first description line, continuation line, landing price, MRP) as printed on DMart POs
+SYNTHETIC_ARTICLES = [
+    ('8908009082084', 'SHAREAT FOOCHKA PANI', 'PURI(1KG)', 84.97, 299.00),
+    ('8908009082299', 'SHAREAT FOOCHKA IMLI', 'PANIPURI(200G)', 37.49, 119.00),
+    ('8908009082152', 'SHAREAT WHOLE WHEAT PANI', 'PURI(200G)', 21.74, 69.00),
+]
+
+
+# ============== SYNTHETIC PDFS ==============
+
+def _pdf_escape(text):
+    return text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+
+def build_pdf(lines, title):
+    """Build a minimal one-page landscape PDF with one Helvetica text line per entry."""
+    content = ['BT', '/F1 8 Tf', '10 TL', '20 570 Td']
+    for line in lines:
+        content.append(f'({_pdf_escape(line)}) Tj T*')
+    content.append('ET')
+    stream = '\n'.join(content).encode('latin-1')
+
+    objects = [
+        b'<< /Type /Catalog /Pages 2 0 R >>',
+        b'<< /Type /Pages /Kids [3 0 R] /Count 1 >>',
+        b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 842 595] '
+        b'/Resources << /Font << /F1 4 0 R >> >> /Contents 5 0 R >>',
+        b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>',
+        b'<< /Length ' + str(len(stream)).encode() + b' >>\nstream\n' + stream + b'\nendstream',
+        b'<< /Title (' + _pdf_escape(title).encode('latin-1') + b') /Producer (loadtest) >>',
+    ]
+    pdf = bytearray(b'%PDF-1.4\n')
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(pdf))
+        pdf += f'{number} 0 obj\n'.encode() + body + b'\nendobj\n'
+    xref_offset = len(pdf)
+    pdf += f'xref\n0 {len(objects) + 1}\n0000000000 65535 f \n'.encode()
+    for offset in offsets:
+        pdf += f'{offset:010d} 00000 n \n'.encode()
+    pdf += f'trailer\n<< /Size {len(objects) + 1} /Root 1 0 R /Info 6 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n'.encode()
+    return bytes(pdf)
+
+
+def synthetic_po_pdf(rng):
+    """Return (filename, bytes) for a random DMart-layout PO with 1-3 catalogued articles."""
+    po_no = str(rng.randint(4540000000, 4549999999))
+    day, month = rng.randint(1, 28), rng.randint(1, 12)
+    lines = [
+        'PURCHASE ORDER',
+        'Ship To Avenue Supermarts Ltd.',
+        f'PSR DMart PO # {po_no}',
+        f'Y Junction Moosapet PO Date {day:02d}.{month:02d}.2026',
+        f'Delivery Dt {day:02d}.{month:02d}.2026',
+        'Hyderabad 500072',
+        'CIN:L51900MH2000PLC126473',
+        'Phone Vendor SRI SAI GOPAL ENTERPRISES',
+        'GSTIN:36AACCA8432H1ZR',
+        'Sno EAN No Article Description UOM Qty Free B.Price Sp.Dis Sch.Val SGST/ CGST/ Cess L.Price MRP T.Value',
+    ]
+    total_qty, total_value = 0, 0.0
+    for sno, (ean, desc, cont, price, mrp) in enumerate(rng.sample(SYNTHETIC_ARTICLES, rng.randint(1, 3)), start=1):
+        qty = rng.randint(1, 30) * 12
+        value = round(qty * price, 2)
+        total_qty += qty
+        total_value += value
+        lines.append(f'{sno} {ean} {desc} EA {qty} 0 {price:.2f} 0.00 0.00 2.50 2.50 0.00 {price:.2f} {mrp:.2f} {value:,.2f}')
+        lines.append(f'{cont} [HSN')
+        lines.append('Code:19059030]')
+    lines.append(f'Total {total_qty} {total_value:.2f}')
+    lines.append('Amount in words RUPEES ONLY')
+    return f'PO_{po_no}.pdf', build_pdf(lines, f'LOADTEST/DMP{po_no}_1')
+
+
+# ============== HTTP ==============
+
+def _request(method, url, token=None, body=None, content_type=None):
+    """Send a request; returns (status, body bytes). HTTP errors are returned, not raised."""
+    headers = {}
+    if token:
+        headers['X-User-Token'] = token
+    if content_type:
+        headers['Content-Type'] = content_type
+    req = urllib.request.Request(url, data=body, headers=headers, method=method)
+    try:
+        with urllib.request.urlopen(req, timeout=300) as resp:
+            return resp.status, resp.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.read()
+
+
+def _multipart(fields, files):
+    boundary = uuid.uuid4().hex
+    body = bytearray()
+    for name, value in fields.items():
+        body += f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode()
+    for name, filename, data in files:
+        body += (f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+                 f'Content-Type: application/pdf\r\n\r\n').encode()
+        body += data + b'\r\n'
+    body += f'--{boundary}--\r\n'.encode()
+    return bytes(body), f'multipart/form-data; boundary={boundary}'
+
+
+class Recorder:
+    """Thread-safe per-endpoint latency and error recording."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = {}
+
+    def call(self, endpoint, method, url, token=None, body=None, content_type=None):
+        started = time.perf_counter()
+        try:
+            status, data = _request(method, url, token, body, content_type)
+        except Exception:
+            status, data = None, b''
+        elapsed = time.perf_counter() - started
+        with self.lock:
+            self.samples.setdefault(endpoint, []).append((elapsed, status))
+        return status, data
+
+
+# ============== SCENARIO ==============
+
+def run_user(recorder, base_url, user_index, sessions, files_per_session, batch_size, account, seed):
+    """One scripted user: log in as account (username, password), then upload/process/download `sessions` batches."""
+    username, password = account
+    rng = random.Random(seed + user_index)
+    status, data = recorder.call('login', 'POST', f'{base_url}/api/auth/login',
+                                 body=json.dumps({'username': username, 'password': password}).encode(),
+                                 content_type='application/json')
+    if status != 200:
+        return
+    token = json.loads(data)['token']
+
+    for _ in range(sessions):
+        pdfs = [synthetic_po_pdf(rng) for _ in range(files_per_session)]
+        session_id = ''
+        for start in range(0, len(pdfs), batch_size):
+            fields = {'session_id': session_id} if session_id else {}
+            body, content_type = _multipart(fields, [('files[]', name, data) for name, data in pdfs[start:start + batch_size]])
+            status, data = recorder.call('upload', 'POST', f'{base_url}/upload', token, body, content_type)
+            if status != 200:
+                break
+            session_id = json.loads(data)['session_id']
+        if not session_id:
+            continue
+
+        waited = 0
+        for attempt in range(1, MAX_PROCESS_ATTEMPTS + 1):
+            status, data = recorder.call('process', 'POST', f'{base_url}/api/process', token,
+                                         json.dumps({'session_id': session_id}).encode(), 'application/json')
+            if status != 429:
+                break
+            wait = json.loads(data).get('retry_after') or 5
+            if attempt == MAX_PROCESS_ATTEMPTS or waited + wait > MAX_PROCESS_WAIT_SECONDS:
+                break
+            time.sleep(wait)
+            waited += wait
+        if status != 200:
+            continue
+        excel_file = json.loads(data).get('excel_file')
+        if excel_file:
+            recorder.call('download', 'GET', f'{base_url}/download/{excel_file}', token)
+
+    recorder.call('logout', 'POST', f'{base_url}/api/auth/logout', token)
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(pct / 100.0 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def summarize(samples, duration):
+    summary = {}
+    for endpoint, entries in samples.items():
+        # 429s are admission-control rejections that the client retries: not failures, and
+        # left out of the latency percentiles (unless every request was rejected)
+        latencies = sorted(elapsed for elapsed, status in entries if status != 429) or sorted(e for e, _ in entries)
+        throttled = sum(1 for _, status in entries if status == 429)
+        errors = sum(1 for _, status in entries if status is None or (status >= 400 and status != 429))
+        summary[endpoint] = {
+            'requests': len(entries),
+            'throttled': throttled,
+            'errors': errors,
+            'error_rate': round(errors / len(entries), 4),
+            'throughput_rps': round(len(entries) / duration, 3) if duration else None,
+            'p50_ms': round(percentile(latencies, 50) * 1000, 1),
+            'p95_ms': round(percentile(latencies, 95) * 1000, 1),
+            'p99_ms': round(percentile(latencies, 99) * 1000, 1),
+            'max_ms': round(latencies[-1] * 1000, 1),
+        }
+    return summary
+
+
+# ============== SERVER ==============
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def create_accounts(runtime_dir, count):
+    """Write `count` load-test users into the throwaway server's users file. Returns [(username, password)].
+
+    Must run before the server starts; app.py adds its default users to this file.
+    """
+    accounts = [(f'loaduser{index + 1}', f'loadtest-{index + 1}') for index in range(count)]
+    data_folder = os.path.join(runtime_dir, 'data')
+    os.makedirs(data_folder, exist_ok=True)
+    users = {
+        username: {
+            'password': hashlib.sha256(password.encode()).hexdigest(),
+            'role': 'user',
+            'name': f'Load Test User {index + 1}',
+            'created': datetime.now().isoformat()
+        }
+        for index, (username, password) in enumerate(accounts)
+    }
+    with open(os.path.join(data_folder, 'users.json'), 'w') as f:
+        json.dump(users, f, indent=2)
+    return accounts
+
+
+def _parse_account(value):
+    username, sep, password = value.partition(':')
+    if not sep or not username:
+        raise argparse.ArgumentTypeError('expected USERNAME:PASSWORD')
+    return username, password
+
+
+def _log_tail(log_path, lines=20):
+    with open(log_path, 'r', errors='replace') as f:
+        return ''.join(f.readlines()[-lines:])
+
+
+def start_server(port, runtime_dir, log_path):
+    """Start app.py's Flask app (threaded, no debug reloader) and wait for /health.
+
+    The server keeps its uploads, outputs and data files in runtime_dir and writes
+    stdout/stderr to log_path.
+    """
+    code = f"from app import app; app.run(host='127.0.0.1', port={port}, threaded=True, debug=False)"
+    env = dict(os.environ, PO_RUNTIME_DIR=runtime_dir)
+    with open(log_path, 'w') as log:
+        proc = subprocess.Popen([sys.executable, '-c', code], cwd=BASE_DIR, env=env,
+                                stdout=log, stderr=subprocess.STDOUT)
+    base_url = f'http://127.0.0.1:{port}'
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f'Server exited during startup:\n{_log_tail(log_path)}')
+        try:
+            if _request('GET', f'{base_url}/health')[0] == 200:
+                return proc, base_url
+        except OSError:
+            pass
+        time.sleep(0.2)
+    proc.terminate()
+    raise RuntimeError(f'Server did not become healthy within 60 s:\n{_log_tail(log_path)}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test the PO extraction API')
+    parser.add_argument('--url', help='Target an already running server instead of starting app.py')
+    parser.add_argument('--users', type=int, default=10, help='Concurrent users (default: 10)')
+    parser.add_argument('--sessions', type=int, default=1, help='Upload/process sessions per user (default: 1)')
+    parser.add_argument('--files', type=int, default=5, help='Synthetic PDFs per session (default: 5)')
+    parser.add_argument('--batch-size', type=int, default=5, help='Files per /upload request, as the frontend sends (default: 5)')
+    parser.add_argument('--account', action='append', type=_parse_account, metavar='USERNAME:PASSWORD',
+                        help='Account for scripted users to log in as (repeatable; users cycle through them). '
+                             'Default: one generated account per user on the local server')
+    parser.add_argument('--username', default='user', help='With --url and no --account: the single shared account')
+    parser.add_argument('--password', default='user123')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--label', default='', help='Free-text label stored with the results')
+    parser.add_argument('--output', '-o', help='Results JSON path (default: loadtest_results/<timestamp>.json)')
+    args = parser.parse_args()
+
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    proc = None
+    runtime_dir = None
+    accounts = args.account
+    base_url = args.url.rstrip('/') if args.url else None
+    if base_url and not accounts:
+        accounts = [(args.username, args.password)]
+        if args.users > 1:
+            print(f"Note: all {args.users} scripted users share account '{args.username}'; "
+                  f"pass --account per user to exercise per-user scheduling")
+    if not base_url:
+        os.makedirs(RESULTS_FOLDER, exist_ok=True)
+        log_path = os.path.join(RESULTS_FOLDER, f'server_{timestamp}.log')
+        runtime_dir = tempfile.mkdtemp(prefix='po_loadtest_')
+        try:
+            if not accounts:
+                accounts = create_accounts(runtime_dir, args.users)
+            proc, base_url = start_server(_free_port(), runtime_dir, log_path)
+        except Exception:
+            shutil.rmtree(runtime_dir, ignore_errors=True)
+            raise
+        print(f"Started local server at {base_url} (log: {log_path})")
+
+    recorder = Recorder()
+    user_failures = []
+    try:
+        print(f"Running {args.users} user(s) x {args.sessions} session(s) x {args.files} file(s)...")
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.users) as pool:
+            futures = [
+                pool.submit(run_user, recorder, base_url, user_index, args.sessions, args.files,
+                            args.batch_size, accounts[user_index % len(accounts)], args.seed)
+                for user_index in range(args.users)
+            ]
+            for future in futures:
+                try:
+                    future.result()
+                except Exception as e:
+                    user_failures.append(f'{type(e).__name__}: {str(e)}')
+        duration = time.perf_counter() - started
+    finally:
+        if proc:
+            proc.terminate()
+            proc.wait()
+        if runtime_dir:
+            shutil.rmtree(runtime_dir, ignore_errors=True)
+
+    results = {
+        'timestamp': datetime.now().isoformat(),
+        'label': args.label,
+        'target': args.url or 'local',
+        'config': {
+            'users': args.users, 'sessions': args.sessions, 'files': args.files,
+            'batch_size': args.batch_size, 'seed': args.seed, 'accounts': len(accounts)
+        },
+        'duration_seconds': round(duration, 3),
+        'user_failures': len(user_failures),
+        'endpoints': summarize(recorder.samples, duration)
+    }
+
+    print(f"\n{'endpoint':<10} {'reqs':>6} {'429s':>6} {'err%':>6} {'rps':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for endpoint, m in results['endpoints'].items():
+        print(f"{endpoint:<10} {m['requests']:>6} {m['throttled']:>6} {m['error_rate'] * 100:>6.1f} {m['throughput_rps']:>8.2f} "
+              f"{m['p50_ms']:>9.1f} {m['p95_ms']:>9.1f} {m['p99_ms']:>9.1f}")
+
+    if user_failures:
+        # A scripted user crashed (e.g. an HTML error page where JSON was expected)
+        print(f"\n{len(user_failures)} scripted user(s) failed; first: {user_failures[0]}")
+
+    output = args.output
+    if not output:
+        os.makedirs(RESULTS_FOLDER, exist_ok=True)
+        output = os.path.join(RESULTS_FOLDER, f'loadtest_{timestamp}.json')
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults saved to: {output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,215 @@
+"""
+OCR Fallback for Image-Only PO Pages
+Renders pages that have no text layer and recognises them with a locally installed
+Tesseract (via the optional pytesseract package). Pages are rendered and recognised
+across a long-lived process pool, each worker opening the PDF once for its chunk of
+pages, and recognised text is cached on disk by page-image hash (bounded by age and size).
+"""
+
+import io
+import os
+import time
+import shutil
+import hashlib
+import tempfile
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import pdfplumber
+
+try:
+    import pytesseract
+except ImportError:  # optional: OCR is skipped when not installed
+    pytesseract = None
+
+
+DEFAULT_OCR_CACHE_DIR = os.path.join(tempfile.gettempdir(), 'po_ocr_cache')
+OCR_RESOLUTION = 300
+OCR_LANG = 'eng'
+
+# Cache entries unused for CACHE_MAX_AGE_SECONDS are dropped, then the least recently
+# used ones until the cache fits in CACHE_MAX_BYTES
+CACHE_MAX_AGE_SECONDS = 30 * 24 * 3600
+CACHE_MAX_BYTES = 200 * 1024 * 1024
+
+_warned_unavailable = False
+
+# One pool for the life of the process. Workers are spawned, not forked, because the
+# callers (Flask request threads, extraction scheduler threads) are multi-threaded.
+_pool = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+def ocr_available():
+    """True if pytesseract is installed and the tesseract binary can be found."""
+    if pytesseract is None:
+        return False
+    return shutil.which(pytesseract.pytesseract.tesseract_cmd) is not None
+
+
+def _cache_path(cache_dir, image_hash):
+    return os.path.join(cache_dir, f'{image_hash}.txt')
+
+
+def _ocr_page(page, cache_dir, resolution, lang):
+    """Render one page and OCR it, using the on-disk cache. Returns (text, cache_hit)."""
+    image = page.to_image(resolution=resolution).original
+    page.close()
+
+    digest = hashlib.sha256()
+    digest.update(f'{image.mode}:{image.size}:{lang}:'.encode())
+    digest.update(image.tobytes())
+    path = _cache_path(cache_dir, digest.hexdigest())
+
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            text = f.read()
+        os.utime(path)  # Mark as recently used for pruning
+        return text, True
+    except OSError:
+        pass
+
+    text = pytesseract.image_to_string(image, lang=lang)
+    # Write then rename so concurrent workers never read a partial cache entry
+    tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+    return text, False
+
+
+def _ocr_chunk(pdf_source, page_numbers, cache_dir, resolution, lang):
+    """OCR several pages, opening the PDF once. Runs in a pool worker or in-process.
+
+    pdf_source is a path or raw PDF bytes. Returns [(page_number, text, cache_hit)].
+    """
+    if isinstance(pdf_source, bytes):
+        pdf_source = io.BytesIO(pdf_source)
+    results = []
+    with pdfplumber.open(pdf_source) as pdf:
+        for page_number in page_numbers:
+            text, cache_hit = _ocr_page(pdf.pages[page_number], cache_dir, resolution, lang)
+            results.append((page_number, text, cache_hit))
+    return results
+
+
+def _get_pool(workers):
+    """Return the shared pool, growing it if more workers are requested than it has."""
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or workers > _pool_workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False)  # Already submitted chunks still complete
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+            _pool_workers = workers
+        return _pool
+
+
+def _discard_pool(pool):
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is pool:
+            _pool, _pool_workers = None, 0
+    pool.shutdown(wait=False)
+
+
+def prune_cache(cache_dir, max_age=CACHE_MAX_AGE_SECONDS, max_bytes=CACHE_MAX_BYTES):
+    """Drop cache entries unused for max_age seconds, then the oldest until under max_bytes."""
+    entries = []
+    now = time.time()
+    for name in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, name)
+        try:
+            info = os.stat(path)
+        except OSError:
+            continue
+        if now - info.st_mtime > max_age:
+            _remove(path)
+        else:
+            entries.append((info.st_mtime, info.st_size, path))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        _remove(path)
+        total -= size
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:  # Already pruned by a concurrent caller
+        pass
+
+
+def ocr_pages(pdf_source, page_numbers, stats=None, workers=None, cache_dir=None,
+              resolution=OCR_RESOLUTION, lang=OCR_LANG):
+    """OCR the given (0-based) pages of a PDF path or bytes. Returns {page_number: text}.
+
+    A single page is recognised in-process; more are split into one chunk per worker
+    across the shared process pool (up to `workers` processes, default: CPU count).
+    If a stats dict is passed, 'ocr_pages', 'ocr_cache_hits' and 'ocr_seconds' are
+    added to it. Newly written cache entries trigger a prune_cache() of cache_dir.
+    """
+    global _warned_unavailable
+    if stats is None:
+        stats = {}
+    stats.setdefault('ocr_pages', 0)
+    stats.setdefault('ocr_cache_hits', 0)
+    stats.setdefault('ocr_seconds', 0.0)
+
+    page_numbers = list(page_numbers)
+    if not page_numbers:
+        return {}
+    if not ocr_available():
+        if not _warned_unavailable:
+            print("Warning: Skipping OCR of image-only pages (pytesseract/Tesseract not installed)")
+            _warned_unavailable = True
+        return {}
+
+    cache_dir = cache_dir or DEFAULT_OCR_CACHE_DIR
+    os.makedirs(cache_dir, exist_ok=True)
+    # Never reopen the caller's stream (it may be mid-parse): use a copy of the bytes
+    if hasattr(pdf_source, 'getvalue'):
+        pdf_source = pdf_source.getvalue()
+    elif isinstance(pdf_source, (bytearray, memoryview)):
+        pdf_source = bytes(pdf_source)
+
+    started = time.perf_counter()
+    texts = {}
+    spill_path = None
+    try:
+        workers = min(workers or os.cpu_count() or 1, len(page_numbers))
+        if workers <= 1:
+            results = _ocr_chunk(pdf_source, page_numbers, cache_dir, resolution, lang)
+        else:
+            if isinstance(pdf_source, bytes):
+                # Workers get a path rather than one pickled copy of the PDF per chunk
+                fd, spill_path = tempfile.mkstemp(suffix='.pdf')
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(pdf_source)
+                pdf_source = spill_path
+            pool = _get_pool(workers)
+            chunks = [page_numbers[i::workers] for i in range(workers)]
+            futures = [pool.submit(_ocr_chunk, pdf_source, chunk, cache_dir, resolution, lang) for chunk in chunks]
+            try:
+                results = [result for future in futures for result in future.result()]
+            except BrokenProcessPool:
+                _discard_pool(pool)
+                raise
+        for page_number, text, cache_hit in results:
+            texts[page_number] = text
+            stats['ocr_pages'] += 1
+            stats['ocr_cache_hits'] += int(cache_hit)
+        if any(not cache_hit for _, _, cache_hit in results):
+            prune_cache(cache_dir)
+    except Exception as e:
+        print(f"Warning: OCR failed: {str(e)}")
+    finally:
+        if spill_path:
+            _remove(spill_path)
+    stats['ocr_seconds'] += time.perf_counter() - started
+    return texts
@@ -0,0 +1,61 @@
+"""
+Content-Addressed Output Store
+Extraction workbooks are stored under the SHA-256 of the extracted data, so identical
+results share one file on disk and the digest doubles as a strong ETag for downloads.
+Optionally a gzip variant is written next to each workbook for clients that accept it.
+"""
+
+import os
+import re
+import gzip
+import shutil
+import hashlib
+
+from po_extractor import format_excel_output
+
+
+DIGEST_RE = re.compile(r'^[0-9a-f]{64}$')
+
+
+def content_digest(df):
+    """SHA-256 of the DataFrame's columns and values (independent of when it was written)."""
+    return hashlib.sha256(df.to_json(orient='split', index=False).encode('utf-8')).hexdigest()
+
+
+def workbook_path(store_dir, digest):
+    return os.path.join(store_dir, f'{digest}.xlsx')
+
+
+def store_workbook(store_dir, df, precompress=False):
+    """Write df as a formatted workbook unless identical data is already stored.
+
+    Returns (digest, created) where created is False for a deduplicated result.
+    """
+    os.makedirs(store_dir, exist_ok=True)
+    digest = content_digest(df)
+    path = workbook_path(store_dir, digest)
+    created = False
+    if not os.path.exists(path):
+        # Write under a temporary name so concurrent identical batches never see a partial file
+        tmp_path = f'{path}.{os.getpid()}.{id(df)}.tmp.xlsx'
+        df.to_excel(tmp_path, index=False, sheet_name='PO Data')
+        format_excel_output(tmp_path)
+        os.replace(tmp_path, path)
+        created = True
+    if precompress and not os.path.exists(path + '.gz'):
+        tmp_path = f'{path}.{os.getpid()}.{id(df)}.tmp.gz'
+        with open(path, 'rb') as src, gzip.open(tmp_path, 'wb') as dst:
+            shutil.copyfileobj(src, dst)
+        os.replace(tmp_path, path + '.gz')
+    return digest, created
+
+
+def find_workbook(store_dir, digest):
+    """Return (path, gzip_path or None) for a stored digest, or (None, None)."""
+    if not DIGEST_RE.match(digest or ''):
+        return None, None
+    path = workbook_path(store_dir, digest)
+    if not os.path.exists(path):
+        return None, None
+    gz_path = path + '.gz'
+    return path, gz_path if os.path.exists(gz_path) else None
@@ -3,15 +3,32 @@ Purchase Order (PO) OCR Extraction Tool
 Extracts data from PO PDFs and exports to Excel format.
 """
 
+import io
 import os
 import re
+import sys
 import glob
+import time
 import pdfplumber
 import pandas as pd
 from datetime import datetime
 from openpyxl import load_workbook
 from openpyxl.styles import Alignment
 
+try:
+    import psutil
+except ImportError:  # optional: used to report RSS where /proc is unavailable
+    psutil = None
+
+try:
+    import resource
+except ImportError:  # not available on Windows, where psutil provides the peak
+    resource = None
+
+from catalogue import get_default_catalogue, load_catalogue, filter_catalogue, enrich_row, CatalogueError
+from layouts import classify_layout
+from ocr import ocr_pages
+
 
 # State codes mapping (first 2 digits of GSTIN)
 STATE_CODES = {
@@ -29,6 +46,12 @@ STATE_CODES = {
     '36': 'Telangana', '37': 'Andhra Pradesh'
 }
 
+# REMARKS value for PDFs whose layout no registered template recognises
+UNKNOWN_LAYOUT_REMARK = 'Unrecognised PO layout'
+# REMARKS values for documents abandoned for exceeding the per-document budget
+PAGE_BUDGET_REMARK = 'Page budget exceeded'
+MEMORY_BUDGET_REMARK = 'Memory budget exceeded'
+
 
 def _format_date_mm_dd_yyyy(date_str):
     """Parse date string (dd/mm/yyyy or dd-mm-yyyy) and return mm/dd/yyyy."""
@@ -47,186 +70,343 @@ def _format_date_mm_dd_yyyy(date_str):
         return date_str
 
 
-def extract_po_data(pdf_path):
-    """Extract purchase order data from a PDF file. Returns a list of rows (one per article line)."""
-    def empty_row():
-        return {
-            'CHAINS': '', 'SITE CODE': '', 'STATE': '', 'VENDOR CODE': '', 'VENDOR NAME': '',
-            'Sales Person': '', 'PO NO': '', 'PO DATE': '', 'DELIVERY DATE': '',
-            'ARTICLE DESCRIPTION': '', 'TOTAL PCS': '', 'BASIC PRICE WITHOUT TAX': '',
-            'TOTAL BASIC PO VALUE WITHOUT TAX': '', 'REMARKS': '', 'GRN AMOUNT': '',
-            'Price/pcs': '', 'Actual Billing Price': '', 'Billing price of Reliance': '',
-            'Price Difference': '', 'Remarks By SO': ''
-        }
-
-    # Article description: capture full text including weight in brackets e.g. SHAREAT FOOCHKA PANI PURI(1KG)
-    # Lookahead (?=...\s+\d) ensures we only end at UOM when followed by quantity (not "KG" inside "(1KG)")
-    article_regex = re.compile(
-        r'(\d{13})\s+'  # EAN (13 digits)
-        r'([\w\s\(\)\-/]+?)\s*'  # Article description (incl. weight like (1KG))
-        r'(?=(?:EA|PC|KG|LT|MT)\s+\d)'  # End only when UOM is followed by quantity
-        r'(?:EA|PC|KG|LT|MT)\s+'  # Unit of measure
-        r'(\d+)\s+'  # Quantity
-        r'\d+\s+'  # Free
-        r'[\d.]+\s+'  # Basic Price (B.Price)
-        r'[\d.]+\s+'  # Special Discount
-        r'[\d.]+\s+'  # Schedule Value
-        r'[\d.]+\s+'  # SGST
-        r'[\d.]+\s+'  # CGST
-        r'[\d.]+\s+'  # Cess
-        r'([\d.]+)\s+'  # Landing Price (L.Price)
-        r'[\d.]+\s+'  # MRP
-        r'([\d,]+\.?\d*)',  # Total Value
-        re.MULTILINE
-    )
+def empty_row():
+    """Return a row with every output column blank."""
+    return {
+        'CHAINS': '', 'SITE CODE': '', 'STATE': '', 'VENDOR CODE': '', 'VENDOR NAME': '',
+        'Sales Person': '', 'PO NO': '', 'PO DATE': '', 'DELIVERY DATE': '',
+        'ARTICLE DESCRIPTION': '', 'TOTAL PCS': '', 'BASIC PRICE WITHOUT TAX': '',
+        'TOTAL BASIC PO VALUE WITHOUT TAX': '', 'REMARKS': '', 'GRN AMOUNT': '',
+        'Price/pcs': '', 'Actual Billing Price': '', 'Billing price of Reliance': '',
+        'Price Difference': '', 'Remarks By SO': '',
+        'EAN': '', 'CATALOGUE NAME': '', 'BRAND': '', 'PACK SIZE': '', 'EXPECTED PRICE': ''
+    }
+
+
+# Named transforms usable in layout field rules
+FIELD_TRANSFORMS = {
+    'strip': lambda value: value.strip(),
+    'date': _format_date_mm_dd_yyyy,
+    'state': lambda value: STATE_CODES.get(value[:2], ''),
+}
+
+
+def _clean_description(desc):
+    desc = re.sub(r'\[HSN.*?\]', '', desc).strip()
+    return re.sub(r'\s+', ' ', desc)
+
+
+def _extract_header(layout, full_text, data):
+    """Fill header columns from the layout's field rules (first matching pattern wins)."""
+    for rule in layout['fields']:
+        for regex in rule['regexes']:
+            match = regex.search(full_text)
+            if match:
+                value = match.group(1)
+                transform = rule.get('transform')
+                if transform:
+                    value = transform(value) if callable(transform) else FIELD_TRANSFORMS[transform](value)
+                data[rule['column']] = value
+                break
+    return data
+
+
+def _extract_articles(layout, full_text, catalogue, data):
+    """Extract ALL catalogued article line items (multiple articles per PO) using the layout's table rules."""
+    table = layout['table']
+    groups = table['groups']
+    rows = []
+
+    article_matches = []
+    ean_matches = list(table['ean_regex'].finditer(full_text))
+    for ean_match in ean_matches:
+        if ean_match.group(1) not in catalogue:
+            continue
+        m = table['row_regex'].match(full_text, ean_match.start())
+        if m:
+            article_matches.append(m)
+
+    for m in article_matches:
+        row = data.copy()
+        desc = m.group(groups['description']).strip()
+        # Append weight-in-brackets from next line if present (e.g. "PURI(1KG)" or "PANIPURI(200G)")
+        continuation_regex = table.get('continuation_regex')
+        if continuation_regex:
+            after_match = full_text[m.end():m.end() + 120]
+            cont = continuation_regex.search(after_match)
+            if cont:
+                desc = desc + ' ' + cont.group(1).strip()
+
+        row['ARTICLE DESCRIPTION'] = _clean_description(desc) if desc else desc
+        row['TOTAL PCS'] = m.group(groups['quantity'])
+        row['BASIC PRICE WITHOUT TAX'] = m.group(groups['price'])
+        row['TOTAL BASIC PO VALUE WITHOUT TAX'] = m.group(groups['total']).replace(',', '')
+        rows.append(enrich_row(row, catalogue[m.group(groups['ean'])]))
+
+    fallback = table.get('fallback')
+    if article_matches or not fallback:
+        return rows
+    # The fallback is for tables the row pattern cannot parse at all; if it parsed
+    # (non-catalogue) lines, the catalogued ones are genuinely absent or malformed
+    if any(table['row_regex'].match(full_text, ean_match.start()) for ean_match in ean_matches):
+        return rows
+
+    # Fallback: single-article extraction with simpler patterns (first catalogued EAN)
+    desc_match = None
+    for candidate in fallback['article_regex'].finditer(full_text):
+        if candidate.group(1) in catalogue:
+            desc_match = candidate
+            break
+    if desc_match:
+        data['ARTICLE DESCRIPTION'] = desc_match.group(2).strip()
+        # Quantity/price from this article's line (up to the next EAN), not the first line in the document
+        line_end = next((m.start() for m in ean_matches if m.start() > desc_match.start()), len(full_text))
+        qty_match = fallback['quantity_regex'].search(full_text, desc_match.start(), line_end)
+        if qty_match:
+            data['TOTAL PCS'] = qty_match.group(1)
+            data['BASIC PRICE WITHOUT TAX'] = qty_match.group(2)
+        # The PO grand total is this article's value only if it is the sole article line
+        total_match = fallback['total_regex'].search(full_text) if len(ean_matches) == 1 else None
+        if total_match:
+            if not data['TOTAL PCS']:
+                data['TOTAL PCS'] = total_match.group(1)
+            data['TOTAL BASIC PO VALUE WITHOUT TAX'] = total_match.group(2).replace(',', '')
+        if data['ARTICLE DESCRIPTION']:
+            data['ARTICLE DESCRIPTION'] = _clean_description(data['ARTICLE DESCRIPTION'])
+        rows.append(enrich_row(data, catalogue[desc_match.group(1)]))
+    return rows
+
+
+_warned_no_rss = False
+
+
+def _current_rss_mb():
+    """Resident set size of this process in MB, or None where it cannot be read."""
+    if psutil is not None:
+        return psutil.Process().memory_info().rss / (1024 * 1024)
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def _peak_rss_mb():
+    """Highest RSS this process has reached (its lifetime high-water mark) in MB, or None."""
+    if psutil is not None and hasattr(psutil.Process().memory_info(), 'peak_wset'):
+        return psutil.Process().memory_info().peak_wset / (1024 * 1024)  # Windows
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Kilobytes on Linux, bytes on macOS
+        return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+    return None
+
+
+def _read_page(page, region=None, release=False, before_release=None):
+    """Extract a page's text, optionally cropped to a fractional (x0, top, x1, bottom) region.
+
+    With release=True the page's cached layout objects are dropped once the text is read
+    (after calling before_release, e.g. to sample memory while they are still held).
+    """
+    target = page
+    if region:
+        x0, top, x1, bottom = page.bbox
+        width, height = x1 - x0, bottom - top
+        target = page.crop((
+            x0 + region[0] * width, top + region[1] * height,
+            x0 + region[2] * width, top + region[3] * height
+        ))
+    text = target.extract_text() or ''
+    if before_release:
+        before_release()
+    if release:
+        for obj in {target, page}:
+            obj.close()
+            obj.get_textmap.cache_clear()
+    return text
+
+
+def _source_name(pdf_source):
+    """Printable name for a PDF path or in-memory buffer."""
+    if isinstance(pdf_source, (str, os.PathLike)):
+        return str(pdf_source)
+    return getattr(pdf_source, 'name', None) or '<in-memory PDF>'
+
+
+def _flagged_row(remark):
+    row = empty_row()
+    row['REMARKS'] = remark
+    return [row]
+
+
+def extract_po_data(pdf_path, catalogue=None, stats=None, low_memory=False, max_pages=None, max_rss_mb=None,
+                    ocr=True, ocr_workers=None, ocr_cache_dir=None):
+    """Extract purchase order data from a PDF file. Returns a list of rows (one per article line).
+
+    pdf_path may also be an in-memory PDF: a binary file-like object (e.g. BytesIO) or
+    bytes / memoryview, so uploads can be extracted without touching disk.
+
+    The PO layout is picked by fingerprinting the PDF metadata and first-page text
+    against the layout registry; unknown layouts yield a single row flagged in REMARKS.
+    Only article lines whose EAN is in the SKU catalogue are kept; each kept row is
+    enriched with catalogue data. Defaults to the catalogue in data/sku_master.csv
+    (CatalogueError is raised if it cannot be loaded).
+
+    low_memory releases each page's parsed objects right after its text is read, crops
+    pages to the layout's header/table regions and stops at the layout's end marker.
+    Documents over max_pages, or during whose extraction RSS grows by more than
+    max_rss_mb, are abandoned and returned as a single row flagged in REMARKS. RSS is
+    process-wide, so growth from extractions running concurrently in other threads
+    is counted too.
+
+    With ocr, pages without a text layer (scanned/faxed) are OCR'd with Tesseract across
+    up to ocr_workers processes, caching text by page-image hash in ocr_cache_dir.
+    Pages that have text are never rendered.
+
+    If a stats dict is passed it receives 'layout' (name or None), 'classify_seconds'
+    (first-page read, plus any OCR of it, and the fingerprint check), 'pages',
+    'peak_rss_mb' (peak RSS growth in MB; None where RSS cannot be measured),
+    'ocr_pages', 'ocr_cache_hits', 'ocr_seconds' and 'error' (message if the PDF could
+    not be read, else None). See extraction_error() for telling failed results apart.
+    """
+    if catalogue is None:
+        catalogue = get_default_catalogue()
+    if stats is None:
+        stats = {}
+    source_name = _source_name(pdf_path)
+    if isinstance(pdf_path, (bytes, bytearray, memoryview)):
+        pdf_path = io.BytesIO(pdf_path)
+    elif hasattr(pdf_path, 'seek'):
+        pdf_path.seek(0)
+    stats['layout'] = None
+    stats['classify_seconds'] = 0.0
+    stats['pages'] = 0
+    # Budgets and peak_rss_mb are growth over the RSS at the start: the process's own
+    # baseline (and memory earlier documents left allocated) is not charged to this one
+    global _warned_no_rss
+    start_rss = _current_rss_mb()
+    start_peak = _peak_rss_mb()
+    if start_rss is None and max_rss_mb and not _warned_no_rss:
+        print("Warning: Cannot read process RSS here (install psutil); memory budget is not enforced")
+        _warned_no_rss = True
+    stats['peak_rss_mb'] = 0.0 if start_rss is not None else None
+    stats['ocr_pages'] = 0
+    stats['ocr_cache_hits'] = 0
+    stats['ocr_seconds'] = 0.0
+    stats['error'] = None
+
+    def sample_rss():
+        rss = _current_rss_mb()
+        if rss is None or start_rss is None:
+            return None
+        growth = rss - start_rss
+        # If the process high-water mark rose since the start, it was set by this document,
+        # including transient layout-analysis peaks that sampling between pages misses
+        peak = _peak_rss_mb()
+        if peak is not None and start_peak is not None and peak > start_peak:
+            growth = max(growth, peak - start_rss)
+        growth = max(0.0, growth)
+        stats['peak_rss_mb'] = max(stats['peak_rss_mb'], growth)
+        return growth
 
     rows = []
     try:
         with pdfplumber.open(pdf_path) as pdf:
-            full_text = ''
-            for page in pdf.pages:
-                text = page.extract_text()
-                if text:
-                    full_text += text + '\n'
-            
-            data = empty_row()
-            
-            # Extract Chain Name (Company name after "Ship To")
-            chain_match = re.search(r'Ship To\s+([\w\s]+Ltd\.?)', full_text)
-            if chain_match:
-                data['CHAINS'] = chain_match.group(1).strip()
-            
-            # Extract Site Code / Address (location details)
-            site_code = ''
-            block_match = re.search(r'Ship To\s+(.*?)CIN:', full_text, re.DOTALL)
-            if block_match:
-                block = block_match.group(1)
-                block = re.sub(r'Avenue Supermarts Ltd\.?', '', block)
-                block = re.sub(r'PO\s*#\s*\d+', '', block)
-                block = re.sub(r'PO\s*Date\s*[\d.]+', '', block)
-                block = re.sub(r'Delivery\s*Dt?\s*[\d.]+', '', block)
-                block = re.sub(r'\n', ' ', block)
-                block = re.sub(r'\s+', ' ', block).strip()
-                parts = []
-                dmart_match = re.search(r'([A-Za-z\s]+(?:DMart|Dmart|DMART))', block)
-                if dmart_match:
-                    parts.append(dmart_match.group(1).strip())
-                    block = block.replace(dmart_match.group(1), '')
-                addr_parts = re.findall(r'([A-Za-z][A-Za-z\s,]+?)(?=\s+[A-Z][a-z]+\s+\d{6}|\s*$)', block)
-                for part in addr_parts:
-                    cleaned = part.strip(' ,')
-                    if cleaned and cleaned not in parts:
-                        parts.append(cleaned)
-                city_pin = re.search(r'([A-Z][a-z]+)\s+(\d{6})', block)
-                if city_pin:
-                    parts.append(f"{city_pin.group(1)} - {city_pin.group(2)}")
-                site_code = ', '.join(parts)
-                site_code = re.sub(r',\s*,', ',', site_code)
-                site_code = re.sub(r'\s+', ' ', site_code).strip(' ,')
-            data['SITE CODE'] = site_code
-            
-            # Extract PO Number
-            po_match = re.search(r'PO\s*#\s*(\d+)', full_text)
-            if po_match:
-                data['PO NO'] = po_match.group(1)
-            
-            # Extract PO Date (output format mm/dd/yyyy)
-            po_date_match = re.search(r'PO\s*Date\s*(\d{2}[./]\d{2}[./]\d{4})', full_text)
-            if po_date_match:
-                data['PO DATE'] = _format_date_mm_dd_yyyy(po_date_match.group(1))
-            
-            # Extract Delivery Date (output format mm/dd/yyyy)
-            delivery_match = re.search(r'Delivery\s*Dt?\s*(\d{2}[./]\d{2}[./]\d{4})', full_text)
-            if delivery_match:
-                data['DELIVERY DATE'] = _format_date_mm_dd_yyyy(delivery_match.group(1))
-            
-            # Extract Vendor Name
-            vendor_match = re.search(r'Vendor\s+([\w\s]+?)(?=\s+GSTIN|\s+Phone|\s+FSSAI|Email)', full_text)
-            if vendor_match:
-                data['VENDOR NAME'] = vendor_match.group(1).strip()
-            else:
-                vendor_match2 = re.search(r'Phone\s+Vendor\s+([\w\s]+?)(?=\s+GSTIN|Email|\n)', full_text)
-                if vendor_match2:
-                    data['VENDOR NAME'] = vendor_match2.group(1).strip()
-            
-            # Extract State from GSTIN (store/ship-to location)
-            gstin_match = re.search(r'GSTIN[:\s]*(\d{2}[A-Z0-9]+)', full_text)
-            if gstin_match:
-                state_code = gstin_match.group(1)[:2]
-                data['STATE'] = STATE_CODES.get(state_code, '')
-            
-            # Vendor code: do not use GST number. Look for explicit "Vendor Code" in PDF if present.
-            vendor_code_match = re.search(r'Vendor\s*Code\s*[:\s]*([A-Za-z0-9\-]+)', full_text, re.IGNORECASE)
-            if vendor_code_match:
-                data['VENDOR CODE'] = vendor_code_match.group(1).strip()
-            
-            # Weight continuation on next line e.g. "PURI(1KG)" or "PANIPURI(200G)" after "SHAREAT FOOCHKA PANI"
-            weight_continuation_re = re.compile(
-                r'\n\s*([A-Za-z]*\s*\(\d+(?:\.\d+)?\s*(?:KG|G|ML|LT)\))\s*\[?',
-                re.IGNORECASE
-            )
-            # Extract ALL article line items (multiple articles per PO)
-            article_matches = list(article_regex.finditer(full_text))
-            if article_matches:
-                for m in article_matches:
-                    row = data.copy()
-                    desc = m.group(2).strip()
-                    # Append weight-in-brackets from next line if present (e.g. "PURI(1KG)" or "PANIPURI(200G)")
-                    after_match = full_text[m.end():m.end() + 120]
-                    cont = weight_continuation_re.search(after_match)
-                    if cont:
-                        desc = desc + ' ' + cont.group(1).strip()
-                    
-                    if 'shareat' not in desc.lower():
-                        continue
-
-                    row['ARTICLE DESCRIPTION'] = desc
-                    row['TOTAL PCS'] = m.group(3)
-                    row['BASIC PRICE WITHOUT TAX'] = m.group(4)
-                    row['TOTAL BASIC PO VALUE WITHOUT TAX'] = m.group(5).replace(',', '')
-                    if row['ARTICLE DESCRIPTION']:
-                        row['ARTICLE DESCRIPTION'] = re.sub(r'\[HSN.*?\]', '', row['ARTICLE DESCRIPTION']).strip()
-                        row['ARTICLE DESCRIPTION'] = re.sub(r'\s+', ' ', row['ARTICLE DESCRIPTION'])
-                    rows.append(row)
-            else:
-                # Fallback: single-article extraction with simpler patterns
-                desc_match = re.search(r'(\d{13})\s+([\w\s\(\)\-/]+?)(?:\s*\[HSN|\s+EA\s+|\s+PC\s+|\s+KG\s+)', full_text)
-                if desc_match:
-                    data['ARTICLE DESCRIPTION'] = desc_match.group(2).strip()
-                qty_match = re.search(r'(?:EA|PC|KG|LT|MT)\s+(\d+)\s+\d+\s+([\d.]+)', full_text)
-                if qty_match:
-                    data['TOTAL PCS'] = qty_match.group(1)
-                    data['BASIC PRICE WITHOUT TAX'] = qty_match.group(2)
-                total_match = re.search(r'Total\s+(\d+)\s+([\d,]+\.?\d*)', full_text)
-                if total_match:
-                    if not data['TOTAL PCS']:
-                        data['TOTAL PCS'] = total_match.group(1)
-                    data['TOTAL BASIC PO VALUE WITHOUT TAX'] = total_match.group(2).replace(',', '')
-                if data['ARTICLE DESCRIPTION']:
-                    data['ARTICLE DESCRIPTION'] = re.sub(r'\[HSN.*?\]', '', data['ARTICLE DESCRIPTION']).strip()
-                    data['ARTICLE DESCRIPTION'] = re.sub(r'\s+', ' ', data['ARTICLE DESCRIPTION'])
-                
-                if 'shareat' in data.get('ARTICLE DESCRIPTION', '').lower():
-                    rows.append(data)
-            
+            stats['pages'] = len(pdf.pages)
+            if max_pages and stats['pages'] > max_pages:
+                print(f"Skipping {source_name}: {stats['pages']} pages exceeds budget of {max_pages}")
+                return _flagged_row(PAGE_BUDGET_REMARK)
+
+            # Classification cost includes reading (or OCRing) the first page it fingerprints
+            started = time.perf_counter()
+            layout = None
+            first_text = None
+            if low_memory:
+                # Metadata only, so the first page can already be cropped to the layout's regions
+                layout = classify_layout('', pdf.metadata)
+            if layout is None:
+                first_text = _read_page(pdf.pages[0], release=low_memory, before_release=sample_rss) if pdf.pages else ''
+                if not first_text and ocr and pdf.pages:
+                    # Image-only first page: OCR it so the layout can still be fingerprinted
+                    first_text = ocr_pages(pdf_path, [0], stats, 1, ocr_cache_dir).get(0, '')
+                layout = classify_layout(first_text, pdf.metadata)
+            stats['classify_seconds'] = time.perf_counter() - started
+
+            if layout is None:
+                print(f"Unrecognised PO layout: {source_name}")
+                return _flagged_row(UNKNOWN_LAYOUT_REMARK)
+            stats['layout'] = layout['name']
+
+            crop = layout.get('crop', {}) if low_memory else {}
+            end_marker = layout.get('end_marker') if low_memory else None
+            texts = {}
+            blank_pages = []
+            for index, page in enumerate(pdf.pages):
+                if index == 0 and first_text is not None:
+                    text = first_text
+                else:
+                    region = crop.get('first_page' if index == 0 else 'pages')
+                    text = _read_page(page, region, release=low_memory, before_release=sample_rss)
+                texts[index] = text
+                if not text:
+                    blank_pages.append(index)
+                growth = sample_rss()
+                if max_rss_mb and growth is not None and growth > max_rss_mb:
+                    print(f"Skipping {source_name}: RSS grew {growth:.0f} MB, exceeding budget of {max_rss_mb} MB")
+                    return _flagged_row(MEMORY_BUDGET_REMARK)
+                if end_marker and end_marker in text:
+                    break
+            if blank_pages and ocr:
+                texts.update(ocr_pages(pdf_path, blank_pages, stats, ocr_workers, ocr_cache_dir))
+            full_text = ''.join(texts[index] + '\n' for index in sorted(texts) if texts[index])
+
+            data = _extract_header(layout, full_text, empty_row())
+            rows = _extract_articles(layout, full_text, catalogue, data)
+
     except Exception as e:
-        print(f"Error processing {pdf_path}: {str(e)}")
+        print(f"Error processing {source_name}: {str(e)}")
+        stats['error'] = str(e)
         rows = [empty_row()]
+    finally:
+        sample_rss()
     
     return rows
 
 
-def process_po_folder(input_folder, output_file=None):
-    """Process all PO PDFs in a folder and export to Excel."""
-    
-    # Find all PDF files (use set to avoid duplicates)
+def extraction_error(rows, stats):
+    """Why an extract_po_data() result is unusable, or None if it is not.
+
+    Unreadable PDFs, unrecognised layouts and over-budget documents still return a
+    (blank or flagged) row; callers use this to report them as failures instead.
+    """
+    if stats.get('error'):
+        return f"Extraction failed: {stats['error']}"
+    if stats['layout'] is None or (rows and rows[0]['REMARKS'] in (PAGE_BUDGET_REMARK, MEMORY_BUDGET_REMARK)):
+        return (rows[0]['REMARKS'] if rows else '') or 'Extraction failed'
+    return None
+
+
+def find_pdf_files(input_folder):
+    """Return absolute paths of all PDFs in a folder and its subfolders."""
+    # Use set to avoid duplicates
     pdf_files = set()
     for pdf in glob.glob(os.path.join(input_folder, '*.pdf')):
         pdf_files.add(os.path.abspath(pdf))
     for pdf in glob.glob(os.path.join(input_folder, '**', '*.pdf'), recursive=True):
         pdf_files.add(os.path.abspath(pdf))
+    return list(pdf_files)
+
+
+def process_po_folder(input_folder, output_file=None, catalogue=None, low_memory=False, max_pages=None, max_rss_mb=None,
+                      ocr=True, ocr_workers=None, profile_dir=None, profile_threshold=2.0, profile_keep=20):
+    """Process all PO PDFs in a folder and export to Excel.
+
+    With profile_dir set, each file is extracted under cProfile and files slower than
+    profile_threshold seconds keep their profile there (only the profile_keep slowest).
+    """
     
-    pdf_files = list(pdf_files)
+    # Find all PDF files
+    pdf_files = find_pdf_files(input_folder)
     
     if not pdf_files:
         print(f"No PDF files found in {input_folder}")
@@ -238,7 +418,24 @@ def process_po_folder(input_folder, output_file=None):
     all_data = []
     for pdf_path in pdf_files:
         print(f"Processing: {os.path.basename(pdf_path)}")
-        rows = extract_po_data(pdf_path)
+        stats = {}
+        extract_args = (pdf_path, catalogue, stats, low_memory, max_pages, max_rss_mb, ocr, ocr_workers)
+        if profile_dir:
+            from profiling import profiled_call
+            rows, elapsed, profile_id = profiled_call(
+                extract_po_data, *extract_args, profile_dir=profile_dir, label=os.path.basename(pdf_path),
+                threshold=profile_threshold, keep=profile_keep
+            )
+            if profile_id:
+                print(f"  Slow file ({elapsed:.2f} s): profile saved as {profile_id}")
+        else:
+            rows = extract_po_data(*extract_args)
+        layout_name = stats['layout'] or 'UNKNOWN'
+        print(f"  Layout: {layout_name} (classified in {stats['classify_seconds'] * 1000:.2f} ms)")
+        if stats['peak_rss_mb'] is not None:
+            print(f"  Pages: {stats['pages']}, peak RSS growth: {stats['peak_rss_mb']:.1f} MB")
+        if stats['ocr_pages']:
+            print(f"  OCR: {stats['ocr_pages']} page(s), {stats['ocr_cache_hits']} cached, {stats['ocr_seconds']:.2f} s")
         all_data.extend(rows)
     
     # Create DataFrame
@@ -298,12 +495,51 @@ def main():
                         help='Input folder containing PO PDF files (default: sample data)')
     parser.add_argument('--output', '-o',
                         help='Output Excel file path (default: auto-generated in input folder)')
+    parser.add_argument('--catalogue', '-c',
+                        help='SKU master CSV (default: data/sku_master.csv)')
+    parser.add_argument('--brand', '-b', action='append',
+                        help='Only keep articles of this catalogue brand (repeatable)')
+    parser.add_argument('--low-memory', action='store_true',
+                        help='Release each page after reading and crop to header/table regions')
+    parser.add_argument('--max-pages', type=int,
+                        help='Skip (flag) documents with more pages than this')
+    parser.add_argument('--max-rss-mb', type=float,
+                        help='Abandon (flag) a document once RSS grows this many MB above its value '
+                             'when the document was opened')
+    parser.add_argument('--no-ocr', action='store_true',
+                        help='Do not OCR pages that have no text layer')
+    parser.add_argument('--ocr-workers', type=int,
+                        help='Processes used to OCR image-only pages (default: CPU count)')
+    parser.add_argument('--profile', action='store_true',
+                        help='Profile each file and keep cProfile captures of slow ones in --profile-dir')
+    parser.add_argument('--profile-dir', default='profiles',
+                        help='Where slow-file profiles are kept (default: profiles)')
+    parser.add_argument('--profile-threshold', type=float, default=2.0,
+                        help='Keep profiles of files taking at least this many seconds (default: 2.0)')
+    parser.add_argument('--profile-keep', type=int, default=20,
+                        help='Number of slowest profiles kept (default: 20)')
+    parser.add_argument('--manifest', '-m',
+                        help='Distributed mode: coordinate with other nodes through this shared SQLite manifest')
+    parser.add_argument('--node-id',
+                        help='Distributed mode: name of this node (default: hostname-pid)')
+    parser.add_argument('--batch-size', type=int, default=20,
+                        help='Distributed mode: files claimed per lease (default: 20)')
+    parser.add_argument('--lease-seconds', type=int, default=600,
+                        help='Distributed mode: lease length before a dead node\'s files are reclaimed (default: 600)')
+    parser.add_argument('--merge', action='store_true',
+                        help='Distributed mode: merge all nodes\' partial outputs into --output')
     
     args = parser.parse_args()
     
     # Get the script directory
     script_dir = os.path.dirname(os.path.abspath(__file__))
     
+    if args.manifest and args.merge:
+        from distributed import merge_manifest
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        merge_manifest(args.manifest, args.output or f'PO_Extracted_{timestamp}.xlsx')
+        return
+    
     # Resolve input folder path
     if os.path.isabs(args.input):
         input_folder = args.input
@@ -319,7 +555,28 @@ def main():
     if output_file and not os.path.isabs(output_file):
         output_file = os.path.join(script_dir, output_file)
     
-    result = process_po_folder(input_folder, output_file)
+    try:
+        catalogue = load_catalogue(args.catalogue) if args.catalogue else get_default_catalogue()
+    except (OSError, CatalogueError) as e:
+        print(f"Error: {str(e)}")
+        return
+    if args.brand:
+        catalogue = filter_catalogue(catalogue, brands=args.brand)
+    
+    if args.manifest:
+        from distributed import init_manifest, run_node
+        added = init_manifest(args.manifest, input_folder)
+        print(f"Manifest {args.manifest}: {added} new file(s) added")
+        run_node(args.manifest, input_folder, args.node_id, args.batch_size, args.lease_seconds,
+                 catalogue=catalogue, low_memory=args.low_memory, max_pages=args.max_pages,
+                 max_rss_mb=args.max_rss_mb, ocr=not args.no_ocr, ocr_workers=args.ocr_workers)
+        return
+    
+    result = process_po_folder(input_folder, output_file, catalogue,
+                               args.low_memory, args.max_pages, args.max_rss_mb,
+                               not args.no_ocr, args.ocr_workers,
+                               args.profile_dir if args.profile else None,
+                               args.profile_threshold, args.profile_keep)
     
     if result:
         print("\nExtracted data preview:")
@@ -0,0 +1,149 @@
+"""
+Extraction Profiling
+Runs extract_po_data under cProfile and keeps profiles only for files slower than a
+latency threshold. Profiles live in a bounded on-disk store that keeps the N slowest,
+each with a pstats text report and a time breakdown (pdfminer layout vs regexes, ...).
+"""
+
+import io
+import os
+import re
+import json
+import time
+import uuid
+import pstats
+import cProfile
+import threading
+from datetime import datetime
+
+
+DEFAULT_THRESHOLD_SECONDS = 2.0
+DEFAULT_KEEP = 20
+REPORT_LINES = 40
+
+PROFILE_ID_RE = re.compile(r'^[0-9a-f]{32}$')
+
+_store_lock = threading.Lock()
+# Only one cProfile may be active per process (on Python 3.12+ a second enable() raises)
+_profiler_lock = threading.Lock()
+
+# Own-time breakdown buckets, matched against the profiled function's file path
+_BREAKDOWN_BUCKETS = [
+    ('pdfminer', 'pdfminer'),
+    ('pdfplumber', 'pdfplumber'),
+    ('extractor', 'po_extractor.py'),
+    ('extractor', 'layouts.py'),
+    ('extractor', 'catalogue.py'),
+]
+
+
+def _bucket(func_key):
+    filename, _, funcname = func_key
+    for bucket, marker in _BREAKDOWN_BUCKETS:
+        if marker in filename:
+            return bucket
+    # Builtins show up as e.g. "<method 'search' of 're.Pattern' objects>"
+    if 're.Pattern' in funcname or '_sre' in funcname or filename.endswith(('re/__init__.py', 're/_compiler.py')):
+        return 'regex'
+    return 'other'
+
+
+def time_breakdown(stats):
+    """Sum own time (seconds) per bucket: pdfminer, pdfplumber, regex, extractor, other."""
+    breakdown = {}
+    for func_key, (_, _, own_time, _, _) in stats.stats.items():
+        bucket = _bucket(func_key)
+        breakdown[bucket] = breakdown.get(bucket, 0.0) + own_time
+    return {bucket: round(seconds, 4) for bucket, seconds in sorted(breakdown.items(), key=lambda item: -item[1])}
+
+
+def save_profile(profile_dir, profiler, elapsed, label, keep=DEFAULT_KEEP, details=None):
+    """Store a profile and evict the fastest beyond `keep`. Returns the profile id, or None if evicted."""
+    os.makedirs(profile_dir, exist_ok=True)
+    profile_id = uuid.uuid4().hex
+
+    report = io.StringIO()
+    stats = pstats.Stats(profiler, stream=report)
+    stats.sort_stats('cumulative').print_stats(REPORT_LINES)
+
+    meta = {
+        'id': profile_id,
+        'label': label,
+        'seconds': round(elapsed, 4),
+        'created': datetime.now().isoformat(),
+        'breakdown': time_breakdown(stats),
+        'details': details or {}
+    }
+
+    with _store_lock:
+        base = os.path.join(profile_dir, profile_id)
+        stats.dump_stats(base + '.prof')
+        with open(base + '.txt', 'w') as f:
+            f.write(f"{label}: {elapsed:.3f} s\n\n{report.getvalue()}")
+        with open(base + '.json', 'w') as f:
+            json.dump(meta, f, indent=2)
+
+        for stale in list_profiles(profile_dir)[keep:]:
+            for ext in ('.json', '.prof', '.txt'):
+                try:
+                    os.remove(os.path.join(profile_dir, stale['id'] + ext))
+                except OSError:
+                    pass
+            if stale['id'] == profile_id:
+                return None
+    return profile_id
+
+
+def list_profiles(profile_dir):
+    """Return stored profile metadata, slowest first."""
+    profiles = []
+    if not os.path.isdir(profile_dir):
+        return profiles
+    for name in os.listdir(profile_dir):
+        if not name.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(profile_dir, name)) as f:
+                profiles.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    return sorted(profiles, key=lambda p: p['seconds'], reverse=True)
+
+
+def profile_file_path(profile_dir, profile_id, fmt='prof'):
+    """Path of a stored profile ('prof' for pstats data, 'txt' for the report), or None."""
+    if not PROFILE_ID_RE.match(profile_id or '') or fmt not in ('prof', 'txt'):
+        return None
+    path = os.path.join(profile_dir, f'{profile_id}.{fmt}')
+    return path if os.path.exists(path) else None
+
+
+def profiled_call(func, *args, profile_dir, label, threshold=DEFAULT_THRESHOLD_SECONDS,
+                  keep=DEFAULT_KEEP, details=None, **kwargs):
+    """Call func under cProfile; keep the profile if the call took at least `threshold` seconds.
+
+    Profiles are taken one at a time per process: while another thread is profiling,
+    the call runs unprofiled and is only timed (its profile_id is then None).
+    Returns (result, elapsed_seconds, profile_id or None).
+    """
+    if not _profiler_lock.acquire(blocking=False):
+        started = time.perf_counter()
+        result = func(*args, **kwargs)
+        return result, time.perf_counter() - started, None
+
+    try:
+        profiler = cProfile.Profile()
+        started = time.perf_counter()
+        profiler.enable()
+        try:
+            result = func(*args, **kwargs)
+        finally:
+            profiler.disable()
+        elapsed = time.perf_counter() - started
+    finally:
+        _profiler_lock.release()
+
+    profile_id = None
+    if elapsed >= threshold:
+        profile_id = save_profile(profile_dir, profiler, elapsed, label, keep, details)
+    return result, elapsed, profile_id